@@ -0,0 +1,112 @@
+"""
+Benchmark the fuzzy scoring backends
+
+Builds a synthetic songbook, scores misspelled queries against it with every
+installed backend, and checks that all backends return the same matches.
+Run it from the repository root:
+
+    python scripts/bench_matching.py [--songs N] [--queries N] [--threshold T ...]
+"""
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from ukebook_helper.index import SongIndex, query_string  # noqa: E402
+from ukebook_helper.matcher import find_matches  # noqa: E402
+from ukebook_helper.models import InputSong, Song  # noqa: E402
+from ukebook_helper.scoring import get_scorer  # noqa: E402
+
+
+WORDS = (
+    'love', 'heart', 'night', 'blue', 'moon', 'river', 'home', 'road', 'summer', 'rain', 'dream',
+    'little', 'sweet', 'baby', 'dance', 'fire', 'golden', 'wild', 'lonely', 'morning', 'sun', 'song',
+    'über', 'liebe', 'wolken', 'sommer', 'nacht', 'mädchen', 'herz', 'straße'
+)
+
+
+def make_songbook(count: int, rng: random.Random) -> Dict[str, Song]:
+    """Make a songbook of random two to five word titles by random artists."""
+    songs = {}
+    for idx in range(count):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+        artist = f"{rng.choice(WORDS).title()} {rng.choice(string.ascii_uppercase)}."
+        songs[f"{title} - {artist} ({idx})"] = Song(title, artist, f"/songbook/song/{idx}/", '')
+    return songs
+
+
+def misspell(text: str, rng: random.Random) -> str:
+    """Drop, swap or replace a few characters, like a hastily typed input list."""
+    chars = list(text)
+    for _ in range(rng.randint(0, 3)):
+        position = rng.randrange(len(chars))
+        edit = rng.choice(('drop', 'swap', 'replace'))
+        if edit == 'drop' and len(chars) > 1:
+            del chars[position]
+        elif edit == 'swap' and position + 1 < len(chars):
+            chars[position], chars[position + 1] = chars[position + 1], chars[position]
+        else:
+            chars[position] = rng.choice(string.ascii_lowercase)
+    return ''.join(chars)
+
+
+def make_queries(songs: Dict[str, Song], count: int, rng: random.Random) -> List[InputSong]:
+    """Pick songs from the songbook and misspell their title and artist."""
+    picked = rng.sample(list(songs.values()), count)
+    return [InputSong(misspell(song.title, rng), misspell(song.artist, rng), '', 'Bench') for song in picked]
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description='Benchmark the fuzzy scoring backends')
+    parser.add_argument('--songs', type=int, default=5000, help='songbook size (default 5000)')
+    parser.add_argument('--queries', type=int, default=60, help='number of queries (default 60)')
+    parser.add_argument('--threshold', type=int, nargs='+', default=[60, 80],
+                        help='similarity thresholds to test (default 60 80)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    songs = make_songbook(args.songs, rng)
+    queries = make_queries(songs, min(args.queries, len(songs)), rng)
+    song_index = SongIndex(songs)
+
+    scorers = []
+    for name in ('thefuzz', 'rapidfuzz'):
+        try:
+            scorers.append(get_scorer(name))
+        except ValueError as e:
+            print(f"Skipping {name}: {e}")
+
+    print(f"{len(songs)} songs, {len(queries)} queries")
+    print(f"{'Threshold':>9}  {'Backend':<10}  {'Full scan ms/query':>18}  {'find_matches ms/query':>21}")
+    failed = False
+    for threshold in args.threshold:
+        results = {}
+        for scorer in scorers:
+            # Scoring every song, as find_matches did before the length and q-gram filters
+            start = time.perf_counter()
+            full = [scorer.score(query_string(query), song_index.combined, threshold) for query in queries]
+            full_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            start = time.perf_counter()
+            matches = [find_matches(query, song_index, threshold, scorer) for query in queries]
+            find_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            results[scorer.name] = (full, [[(m.song.href, m.similarity) for m in found] for found in matches])
+            print(f"{threshold:>9}  {scorer.name:<10}  {full_ms:>18.3f}  {find_ms:>21.3f}")
+
+        outputs = list(results.values())
+        if any(output != outputs[0] for output in outputs[1:]):
+            print(f"Error: The backends disagree at threshold {threshold}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Check that starting the CLI stays cheap
+
+Imports ukebook_helper.__main__ in a fresh interpreter with -X importtime and
+fails if any of the heavy dependencies were loaded, or the import took longer
+than the budget. It then runs main() up to the point where the network phase
+is submitted and fails if anything but the network libraries was loaded by
+then. Run it from the repository root:
+
+    python scripts/check_import_time.py [--budget MS] [--show N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Set, Tuple
+
+
+# Top-level packages that must only be imported once they are actually needed
+DEFERRED = ('requests', 'urllib3', 'prompt_toolkit', 'thefuzz', 'rapidfuzz', 'numpy', 'http.server')
+
+# Of those, the packages the network phase itself needs
+NETWORK = ('requests', 'urllib3')
+
+# Cumulative import time of ukebook_helper.__main__ allowed, in milliseconds
+DEFAULT_BUDGET_MS = 60
+
+# Runs main() in the child interpreter and prints the loaded modules once the
+# network phase is submitted, stopping there
+PROBE = """
+import json, sys
+import ukebook_helper.__main__ as cli
+
+class Submitted(BaseException):
+    pass
+
+class ProbeExecutor(cli.ThreadPoolExecutor):
+    def submit(self, fn, *args, **kwargs):
+        if fn in (cli.connect, cli.load_cached):
+            print(json.dumps(sorted(sys.modules)))
+            raise Submitted()
+        return super().submit(fn, *args, **kwargs)
+
+cli.ThreadPoolExecutor = ProbeExecutor
+sys.argv = ['ukebook_helper', 'config.toml']
+try:
+    cli.main()
+except Submitted:
+    pass
+else:
+    sys.exit("The network phase was never submitted")
+"""
+
+# Config the probe runs main() with, no request is made before the submit
+PROBE_CONFIG = """
+host_url = "http://127.0.0.1:9"
+username = "user"
+password = "password"
+cache_dir = "cache"
+"""
+
+
+def import_times(module: str) -> List[Tuple[str, int]]:
+    """
+    Import a module in a fresh interpreter and collect its -X importtime report.
+
+    Returns:
+        List of (module name, cumulative microseconds) imported after interpreter
+        startup, in import order
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=child_env(), check=False
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(1)
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == 'site' and not name.startswith('  '):
+            times = []  # Everything so far was interpreter startup
+            continue
+        times.append((name.strip(), int(cumulative)))
+    return times
+
+
+def child_env() -> dict:
+    """Get the environment of the child interpreter, with the package on its path."""
+    src = Path(__file__).resolve().parent.parent / 'src'
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(src), os.environ.get('PYTHONPATH')])))
+
+
+def modules_at_submit() -> Set[str]:
+    """
+    Run main() in a fresh interpreter until the network phase is submitted.
+
+    Returns:
+        Names of the modules loaded at that point
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        Path(directory, 'config.toml').write_text(PROBE_CONFIG, encoding='utf-8')
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            capture_output=True, text=True, env=child_env(), cwd=directory, check=False
+        )
+    if result.returncode != 0:
+        print(result.stdout + result.stderr)
+        sys.exit(1)
+    return set(json.loads(result.stdout.strip().splitlines()[-1]))
+
+
+def main():
+    """Run the check."""
+    parser = argparse.ArgumentParser(description='Check the import time of the ukebook_helper CLI')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'maximum import time in milliseconds (default {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--show', type=int, default=10, help='number of slowest imports to list')
+    args = parser.parse_args()
+
+    times = import_times('ukebook_helper.__main__')
+    total_ms = dict(times)['ukebook_helper.__main__'] / 1000
+    loaded = {
+        package for name, _ in times for package in DEFERRED
+        if name == package or name.startswith(package + '.')
+    }
+
+    print(f"ukebook_helper.__main__ imported in {total_ms:.1f} ms (budget {args.budget:.0f} ms)")
+    print("Slowest imports:")
+    for name, cumulative in sorted(times, key=lambda item: item[1], reverse=True)[:args.show]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if loaded:
+        print(f"Error: Imported at startup although deferred: {', '.join(sorted(loaded))}")
+        failed = True
+    if total_ms > args.budget:
+        print("Error: Import time over budget")
+        failed = True
+
+    at_submit = {
+        package for name in modules_at_submit() for package in DEFERRED
+        if package not in NETWORK and (name == package or name.startswith(package + '.'))
+    }
+    if at_submit:
+        print(f"Error: Imported before the network phase was submitted: {', '.join(sorted(at_submit))}")
+        failed = True
+    else:
+        print("Only the network libraries were imported before the network phase was submitted")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,4 +17,14 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
-"""Ukebook Helper - A tool to help with Ukebook website interactions""" 
\ No newline at end of file
+"""Ukebook Helper - A tool to help with Ukebook website interactions""" 
+
+__all__ = ['main']
+
+
+def __getattr__(name: str):
+    """Import the CLI entry point on first use, keeping a plain package import light."""
+    if name == 'main':
+        from .__main__ import main
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -20,15 +20,35 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 """
 Command line interface for Ukebook Helper
 """
+import argparse
+import atexit
+import os
+import sqlite3
 import sys
+import threading
 import webbrowser
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional
 from urllib.parse import urljoin
 import tomli
-from .client import UkebookClient
-from .models import read_input_list
-from .matcher import find_matches
-from .ui import select_match, confirm_action, confirm_break
+from .aliases import AliasStore
+from .cache import SongbookCache, DEFAULT_MAX_AGE
+from .models import InputSong, Song, SongbookDiff, read_input_list
+from .index import SongIndex
+from .match_cache import MatchCache, DEFAULT_MAX_ENTRIES
+from .profiling import profiler
+from .store import SongStore, DEFAULT_CANDIDATE_LIMIT, fts_available
+from .stats import stats
+
+# The modules pulling in requests, prompt_toolkit and the fuzzy matching
+# libraries are imported where they are first needed, so --help and config
+# errors return at once and the network phase starts before the TUI is loaded
+if TYPE_CHECKING:
+    from .client import UkebookClient
+    from .matcher import MatchList, MatchTable
+    from .pages import Prefetcher
 
 
 def read_config(config_path: str) -> dict:
@@ -47,15 +67,254 @@ def read_config(config_path: str) -> dict:
         sys.exit(1)
 
 
+def format_bytes(size: int) -> str:
+    """Format a byte count for display."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024 or unit == 'MiB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def print_summary():
+    """Print the run summary."""
+    counters = stats.snapshot()
+    print("\nRun summary:")
+    wire_bytes = counters.get('transfer.wire_bytes', 0)
+    decoded_bytes = counters.get('transfer.decoded_bytes', 0)
+    if decoded_bytes:
+        print(f"  Songbook transfer: {format_bytes(wire_bytes)} over the wire, "
+              f"{format_bytes(decoded_bytes)} decoded "
+              f"({format_bytes(decoded_bytes - wire_bytes)} saved by compression)")
+    else:
+        print("  Songbook transfer: served from cache")
+    if counters.get('match.alias_hits'):
+        print(f"  Remembered song choices used: {counters['match.alias_hits']}")
+    if counters.get('match.gema_hits'):
+        print(f"  GEMA number hits: {counters['match.gema_hits']}")
+    if counters.get('gema.failed'):
+        print(f"  GEMA number lookups failed: {counters['gema.failed']} (retried next run)")
+    if counters.get('match.cache_hits'):
+        print(f"  Match results reused from cache: {counters['match.cache_hits']}")
+    if counters.get('prefetch.pages') or counters.get('prefetch.hits'):
+        print(f"  Local song pages: {counters.get('prefetch.pages', 0)} downloaded "
+              f"({counters.get('prefetch.assets', 0)} linked files), "
+              f"{counters.get('prefetch.hits', 0)} opened from the local copy")
+    if counters.get('match.queries'):
+        print(f"  Matching: {counters['match.queries']} queries, "
+              f"{counters.get('match.scored', 0)} songs scored, "
+              f"{counters.get('match.pruned_length', 0)} pruned by length, "
+              f"{counters.get('match.pruned_qgram', 0)} pruned by q-gram filter")
+
+
+def print_profile(show_summary: bool, trace_path: Optional[str]) -> None:
+    """
+    Print the phase timings and write the trace file, registered to run at exit.
+
+    Args:
+        show_summary: Print the table of phase timings
+        trace_path: File to write the Chrome trace events to (None for no trace)
+    """
+    if show_summary:
+        print("\nPhase timings:")
+        print(profiler.summary())
+    if trace_path:
+        try:
+            profiler.write_trace(trace_path)
+            print(f"\nTrace written to {trace_path} (open it in https://ui.perfetto.dev)")
+        except OSError as e:
+            print(f"WARNING: Could not write trace file: {e}")
+
+
+# Seconds the login and songbook download may take before the cached songbook is used instead
+DEFAULT_STARTUP_BUDGET = 20
+
+# Values of the scorer config key, checked before the scoring backends are imported
+SCORER_NAMES = ('auto', 'rapidfuzz', 'thefuzz')
+
+
+class LoadedSongbook(NamedTuple):
+    """Result of the background network phase."""
+    song_index: SongIndex
+    diff: Optional[SongbookDiff] = None  # Changes since the previous run, None if unknown
+    warning: Optional[str] = None        # Problems to report, e.g. that the cached songbook had to be used
+
+
+def connect(client: 'UkebookClient', username: str, password: str, refresh: bool,
+            gema_lookup: bool = False, startup_budget: Optional[float] = None) -> LoadedSongbook:
+    """
+    Log in (reusing the saved session if possible), fetch the songbook and index it.
+
+    Runs on a background thread, so it reports problems by raising, or in the
+    warning of the result, instead of printing.
+    If the website cannot be reached within the startup budget, the cached
+    songbook is used instead. With gema_lookup, GEMA numbers found by earlier
+    runs are filled in; the detail pages of the others are left to lookup_gema_numbers.
+
+    Raises:
+        RuntimeError: If the login fails, or the website is unreachable and nothing is cached
+    """
+    from .client import NetworkUnavailable
+
+    try:
+        with client.deadline(startup_budget):
+            if not client.restore_session() and not client.login(username, password):
+                raise RuntimeError("Login failed!")
+            songs = client.fetch_songs(refresh=refresh, quiet=True)
+    except NetworkUnavailable as e:
+        try:
+            if client.cache is None:
+                raise RuntimeError("No cached songbook")
+            loaded = load_cached(client.cache, client.host_url)
+        except RuntimeError:
+            raise RuntimeError(f"{e}\nNo song list from an earlier run to fall back to!") from e
+        return loaded._replace(warning=f"WARNING: {e}\nUsing the song list from the last run instead")
+    if not songs and client.cache is not None:
+        # The download broke off, the songbook from the last run beats none at all
+        try:
+            loaded = load_cached(client.cache, client.host_url)
+        except RuntimeError:
+            return LoadedSongbook(SongIndex(songs), warning=client.last_error)
+        return loaded._replace(warning="\n".join(filter(None, [
+            client.last_error, "WARNING: Could not download the song list, using the one from the last run"
+        ])))
+    if not songs:
+        return LoadedSongbook(SongIndex(songs), warning=client.last_error)
+    if gema_lookup and client.cache is not None:
+        songs = with_known_gema_numbers(client.cache, client.host_url, songs)
+    return LoadedSongbook(SongIndex(songs), client.last_diff)
+
+
+def with_known_gema_numbers(cache: SongbookCache, host_url: str, songs: Dict[str, Song]) -> Dict[str, Song]:
+    """Fill in the GEMA numbers that earlier runs found on the song detail pages."""
+    known = cache.load_gema_numbers(host_url)
+    return {
+        key: song._replace(gema_nr=known.get(song.href, '')) if not song.gema_nr else song
+        for key, song in songs.items()
+    }
+
+
+def lookup_gema_numbers(client: 'UkebookClient', song_index: SongIndex) -> Optional[LoadedSongbook]:
+    """
+    Fetch the GEMA numbers still missing from the song detail pages.
+
+    Runs after the songbook has been delivered, without the startup budget;
+    pages that cannot be fetched are only counted for the run summary.
+
+    Returns:
+        The songbook with the numbers filled in and the songs that changed, or None if none were found
+    """
+    songs = song_index.as_dict()
+    updated = client.fetch_gema_numbers(songs, quiet=True)
+    changed = [(old, new) for old, new in zip(songs.values(), updated.values()) if old != new]
+    if not changed:
+        return None
+    diff = SongbookDiff(added=[], removed=[], changed=changed)
+    return LoadedSongbook(song_index.with_diff(updated, diff), diff)
+
+
+def load_cached(cache: SongbookCache, host_url: str) -> LoadedSongbook:
+    """
+    Index the cached songbook, however old it is, for a session without network access.
+
+    Raises:
+        RuntimeError: If there is no cached songbook
+    """
+    cached = cache.load(host_url, include_expired=True)
+    if cached is None:
+        raise RuntimeError("No cached songbook, run with --mirror while online first!")
+    return LoadedSongbook(SongIndex(with_known_gema_numbers(cache, host_url, cached.songs)))
+
+
+def run_mirror(match_table: 'MatchTable', input_songs: list, network: Future, prefetcher: 'Prefetcher',
+               extra_hrefs: List[str], matches_per_song: int) -> None:
+    """Mirror the pages of the best matches of every input list entry, plus the given pages."""
+    from .mirror import mirror_pages
+
+    wait_for_songbook(network)
+    hrefs = []
+    for index, entry in enumerate(input_songs):
+        if isinstance(entry, InputSong):
+            hrefs.extend(match.song.href for match in reversed(match_table.get(index)[-matches_per_song:]))
+    hrefs.extend(extra_hrefs)
+
+    def progress(done: int, total: int) -> None:
+        print(f"\rMirroring song pages: {done}/{total}", end='', flush=True)
+
+    downloaded, stored, failed = mirror_pages(prefetcher, hrefs, progress)
+    print(f"\nMirrored {downloaded} pages ({stored} already mirrored, {failed} failed)")
+    if failed:
+        print("Run --mirror again to retry the failed pages")
+
+
+def print_diff(diff: SongbookDiff, limit: int = 5, echo: Callable[[str], None] = print) -> None:
+    """Print the changes to the songbook, listing at most limit songs per kind of change."""
+    echo(f"Songbook changes since last run: {len(diff.added)} added, "
+         f"{len(diff.removed)} removed, {len(diff.changed)} changed")
+    for label, songs in (('+', diff.added), ('-', diff.removed), ('~', [new for _, new in diff.changed])):
+        for song in songs[:limit]:
+            echo(f"  {label} {song.title} - {song.artist}" if song.artist else f"  {label} {song.title}")
+        if len(songs) > limit:
+            echo(f"  {label} ... and {len(songs) - limit} more")
+
+
+def wait_for_songbook(network: Future, echo: Callable[[str], None] = print) -> SongIndex:
+    """
+    Wait for the background network phase and return the songbook index.
+
+    Args:
+        network: Future of the network phase
+        echo: Where to print messages, e.g. the session UI's log
+    """
+    try:
+        song_index, diff, warning = network.result()
+    except RuntimeError as e:
+        echo(str(e))
+        sys.exit(1)
+
+    if warning:
+        echo(warning)
+    if not song_index:
+        echo("No songs found!")
+        sys.exit(1)
+
+    echo(f"\nFound {len(song_index)} songs on the website")
+    if diff is not None and not diff.empty:
+        print_diff(diff, echo=echo)
+    return song_index
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog='ukebook_helper',
+        description='Ukebook Helper - A tool for managing Ukebook song selections',
+        epilog='Example: ukebook_helper config.toml'
+    )
+    parser.add_argument('config_file', help='path to the TOML config file')
+    parser.add_argument('--refresh', action='store_true',
+                        help='ignore the songbook cache and force a full fetch')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--mirror', action='store_true',
+                      help='download the song pages needed for input.list and the break page, then exit')
+    mode.add_argument('--offline', action='store_true',
+                      help='use the cached songbook and serve the mirrored pages locally, without network access')
+    parser.add_argument('--profile', action='store_true',
+                        help='print how long each phase of the run took on exit')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write the phase timings to FILE as Chrome trace events, for Perfetto')
+    return parser.parse_args()
+
+
 def main():
     """Main entry point for the Ukebook Helper CLI."""
-    if len(sys.argv) != 2:
-        print("Usage: ukebook_helper <config_file>")
-        print("Example: ukebook_helper config.toml")
-        sys.exit(1)
+    args = parse_args()
+    if args.profile or args.trace:
+        profiler.enable()
+        atexit.register(print_profile, args.profile, args.trace)
 
     # Read config file
-    config = read_config(sys.argv[1])
+    with profiler.span('config'):
+        config = read_config(args.config_file)
 
     try:
         host_url = config['host_url']
@@ -68,8 +327,89 @@ def main():
     # Get optional break URL
     break_url = config.get('break_url')
 
-    # Initialize client
-    client = UkebookClient(host_url)
+    scorer_name = config.get('scorer', 'auto')
+    if scorer_name not in SCORER_NAMES:
+        print(f"Error: Unknown scorer: {scorer_name}")
+        sys.exit(1)
+
+    # Initialize client with the on-disk songbook cache
+    cache = SongbookCache(
+        config.get('cache_dir'),
+        max_age=config.get('cache_max_age', DEFAULT_MAX_AGE)
+    )
+    session_file = None
+    if config.get('persist_session', True):
+        session_file = config.get('session_file') or cache.session_path(host_url)
+    song_store = None
+    if config.get('song_store', False):
+        if not fts_available():
+            print("WARNING: Song store disabled, SQLite was built without FTS5 trigram support")
+        else:
+            try:
+                song_store = SongStore(config.get('song_store_file') or cache.store_path(host_url))
+            except (OSError, sqlite3.Error) as e:
+                print(f"WARNING: Song store disabled: {e}")
+    from .client import RequestPolicy, UkebookClient
+    defaults = RequestPolicy()
+    client = UkebookClient(
+        host_url,
+        cache=cache,
+        compression=config.get('compression', True),
+        session_file=session_file,
+        store=song_store,
+        policy=RequestPolicy(
+            connect_timeout=config.get('connect_timeout', defaults.connect_timeout),
+            read_timeout=config.get('read_timeout', defaults.read_timeout),
+            retries=config.get('retries', defaults.retries),
+            backoff=config.get('retry_backoff', defaults.backoff)
+        )
+    )
+
+    # Download the pages of upcoming songs ahead of time, or serve the mirrored ones when offline
+    # --mirror needs the network, so it overrides offline = true in the config
+    offline = args.offline or (config.get('offline', False) and not args.mirror)
+    prefetch_count = 0 if offline else config.get('prefetch', 3)
+    pages_dir = config.get('pages_dir') or cache.pages_dir(host_url)
+    page_cache = None
+    prefetcher = None
+    mirror_server = None
+    if offline or prefetch_count or args.mirror:
+        from .pages import PageCache, Prefetcher
+    if offline:
+        from .mirror import MirrorServer  # Pulls in http.server, only needed to serve the mirror
+        page_cache = PageCache(pages_dir, host_url)
+        try:
+            mirror_server = MirrorServer(page_cache, port=config.get('mirror_port', 0))
+        except OSError as e:
+            print(f"Error: Could not start the local mirror server: {e}")
+            sys.exit(1)
+        mirror_server.start()
+    elif prefetch_count or args.mirror:
+        page_cache = PageCache(pages_dir, host_url, max_age=cache.max_age)
+        prefetcher = Prefetcher(
+            client,
+            page_cache,
+            max_workers=config.get('mirror_workers', 4) if args.mirror else 2
+        )
+
+    def prefetch_best(matches: 'MatchList') -> None:
+        """Prefetch the page of the match that is selected by default."""
+        if matches:
+            prefetcher.prefetch(matches[-1].song.href)
+
+    # Log in and fetch songs in the background while the local setup continues
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='network')
+    if offline:
+        print("Offline: using the cached song list and mirrored song pages")
+        network = executor.submit(load_cached, cache, host_url)
+    else:
+        print("Fetching song list...")
+        network = executor.submit(
+            connect, client, username, password, args.refresh, config.get('gema_lookup', False),
+            config.get('startup_budget', DEFAULT_STARTUP_BUDGET)
+        )
+    executor.shutdown(wait=False)
+    song_index = None
 
     # Read input list
     try:
@@ -79,114 +419,241 @@ def main():
         print("Error: input.list file not found!")
         sys.exit(1)
 
-    # Attempt login
-    if not client.login(username, password):
-        print("Login failed!")
+    # Match the whole input list on a worker pool as soon as the songbook arrives
+    from .matcher import MatchTable
+    from .refresh import SongbookRefresher, DEFAULT_REFRESH_INTERVAL
+    from .scoring import get_scorer
+    try:
+        scorer = get_scorer(scorer_name)
+    except ValueError as e:
+        print(f"Error: {e}")
+        client.cancel()
         sys.exit(1)
+    match_executor = ThreadPoolExecutor(
+        max_workers=config.get('match_workers', min(4, os.cpu_count() or 1)),
+        thread_name_prefix='matcher'
+    )
+    aliases = None
+    if config.get('learn_aliases', True):
+        aliases = AliasStore(config.get('alias_file') or cache.aliases_path(host_url))
+    match_cache = None
+    if config.get('match_cache', True):
+        try:
+            match_cache = MatchCache(
+                cache.matches_path(host_url),
+                max_entries=config.get('match_cache_size', DEFAULT_MAX_ENTRIES)
+            )
+        except (OSError, sqlite3.Error) as e:
+            print(f"WARNING: Match cache disabled: {e}")
+    match_table = MatchTable(
+        input_songs,
+        match_executor,
+        scorer=scorer,
+        limit=config.get('match_limit', 20) or None,
+        aliases=aliases,
+        match_cache=match_cache,
+        song_store=song_store,
+        candidate_limit=config.get('fts_candidates', DEFAULT_CANDIDATE_LIMIT)
+    )
 
-    print("Successfully logged in!")
+    def forget_removed(song_index: SongIndex, diff: Optional[SongbookDiff]) -> None:
+        """Drop remembered choices of songs that left the songbook."""
+        if aliases is not None:
+            if diff is not None:
+                aliases.forget({song.href for song in diff.removed})
+            else:
+                aliases.prune(song_index.by_href)
 
-    # Fetch songs
-    print("\nFetching song list...")
-    available_songs = client.fetch_songs()
+    def apply_refresh(song_index: SongIndex, diff: Optional[SongbookDiff]) -> None:
+        """Switch the matching over to a refreshed songbook."""
+        forget_removed(song_index, diff)
+        match_table.update(song_index)
 
-    if not available_songs:
-        print("No songs found!")
-        sys.exit(1)
+    refresher = None
+    refresh_interval = 0 if offline or args.mirror else config.get('refresh_interval', DEFAULT_REFRESH_INTERVAL)
 
-    print(f"\nFound {len(available_songs)} songs on the website")
+    def start_refresher(song_index: SongIndex) -> None:
+        """Start the periodic refresh of the songbook."""
+        nonlocal refresher
+        if refresh_interval and not match_table.closed:
+            refresher = SongbookRefresher(
+                client,
+                song_index,
+                apply_refresh,
+                interval=refresh_interval,
+                gema_lookup=config.get('gema_lookup', False)
+            )
+            refresher.start()
 
-    # Open initial URLs
-    if confirm_action("Open Ukebook website and songbook?"):
-        if break_url:
-            webbrowser.open(urljoin(host_url, break_url))
-        webbrowser.open(urljoin(host_url, '/songbook/'))
-        print("\033[2J\033[H")  # Clear screen
+    def complete_songbook(song_index: SongIndex) -> None:
+        """Fill in the missing GEMA numbers, then start the periodic refresh."""
+        completed = lookup_gema_numbers(client, song_index)
+        if completed is not None and not match_table.closed:
+            song_index = completed.song_index
+            apply_refresh(song_index, completed.diff)
+        start_refresher(song_index)
+
+    def start_matching(future: Future) -> None:
+        """Start the batch matching, and the GEMA lookup and periodic refresh, once the songbook has been fetched."""
+        if future.exception() is None and future.result()[0]:
+            song_index, diff, _ = future.result()
+            forget_removed(song_index, diff)
+            match_table.start(song_index)
+            if not client.is_logged_in:
+                return
+            if config.get('gema_lookup', False):
+                # The detail pages are fetched after the songbook is shown, not within the startup budget
+                threading.Thread(target=complete_songbook, args=(song_index,), name='gema', daemon=True).start()
+            else:
+                start_refresher(song_index)
+
+    network.add_done_callback(start_matching)
+
+    if args.mirror:
+        extra_hrefs = ['/songbook/']
+        if break_url and page_cache.is_local(urljoin(host_url, break_url)):
+            extra_hrefs.append(break_url)
         try:
-            input()
+            run_mirror(match_table, input_songs, network, prefetcher, extra_hrefs, config.get('mirror_matches', 3))
         except KeyboardInterrupt:
-            print("\nOperation cancelled by user")
-            sys.exit(0)
-
-    # Process input songs
-    print("\nProcessing input list:")
-    selected_songs = []
-    i = 0
-    while i < len(input_songs):
-        entry = input_songs[i]
-
-        if entry == "Break":
-            # Skip break handling if break_url is not configured
-            if not break_url:
+            print("\nMirroring interrupted, run --mirror again to resume")
+        finally:
+            # Pages already downloading stop at their next request, so exit does not wait for them
+            client.cancel()
+            match_table.close()
+            prefetcher.shutdown()
+            match_executor.shutdown(wait=False, cancel_futures=True)
+        return
+
+    def open_page(url: str) -> bool:
+        """
+        Open a page of the site in the browser, preferring a local copy.
+
+        Returns:
+            bool: True if a local copy was opened
+        """
+        local_url = None
+        if mirror_server is not None:
+            local_url = mirror_server.url_for(url)
+        elif page_cache is not None:
+            local_url = page_cache.local_url(url)
+        webbrowser.open(local_url or urljoin(host_url, url))
+        return local_url is not None
+
+    # Loaded while the network phase is still running
+    from .ui import SessionUI
+
+    ui = SessionUI()
+    ui.start()
+    try:
+        # Open initial URLs
+        if ui.confirm("Open Ukebook website and songbook?"):
+            if break_url:
+                open_page(break_url)
+            open_page('/songbook/')
+            ui.pause()
+
+        # Process input songs
+        ui.log("Processing input list:")
+        selected_songs = []
+        i = 0
+        while i < len(input_songs):
+            entry = input_songs[i]
+
+            if entry == "Break":
+                # Skip break handling if break_url is not configured
+                if not break_url:
+                    i += 1
+                    continue
+
+                take_break, go_back = ui.confirm_break()
+                if go_back:
+                    i = max(0, i - 1)  # Go back one song, but not before the start
+                    continue
+                if take_break:
+                    selected_songs.append(("break", None))
+                    ui.log("--- BREAK ---")
+                    open_page(break_url)
+                    ui.pause()
                 i += 1
                 continue
 
-            print("\n--- BREAK ---")
-            take_break, go_back = confirm_break()
+            # Show the current performer announcement
+            ui.announce(entry.leader, entry.title)
+            ui.log(f"Processing: {entry.title} - {entry.artist} (leader: {entry.leader})")
+
+            # Get the precomputed matches, waiting for the songbook the first time it is needed
+            if song_index is None:
+                ui.wait(network.exception, "Loading the songbook...")
+                song_index = wait_for_songbook(network, echo=ui.log)
+            matches = ui.wait(partial(match_table.get, i), "Matching...")
+            if prefetcher is not None:
+                for upcoming in range(i, min(i + prefetch_count + 1, len(input_songs))):
+                    if isinstance(input_songs[upcoming], InputSong):
+                        match_table.when_ready(upcoming, prefetch_best)
+            if not matches:
+                ui.log("No matches found!")
+                if ui.confirm("Skip this song?"):
+                    i += 1
+                    continue
+                else:
+                    sys.exit(1)
+
+            # Let user select the match
+            selected, go_back = ui.select_match(
+                matches,
+                f"{entry.title} - {entry.artist}",
+                more=matches.discarded,
+                alternatives=(lambda: match_table.alternatives(i)) if match_table.is_alias(i) else None,
+                notice=refresher.describe() if refresher is not None else None
+            )
             if go_back:
                 i = max(0, i - 1)  # Go back one song, but not before the start
                 continue
-            if take_break:
-                selected_songs.append(("break", None))
-                webbrowser.open(urljoin(host_url, break_url))
-                print("\033[2J\033[H")  # Clear screen
-                try:
-                    input()
-                except KeyboardInterrupt:
-                    print("\nOperation cancelled by user")
-                    sys.exit(0)
-            i += 1
-            continue
-
-        # Show the current performer announcement
-        print("\033[2J\033[H")  # Clear screen
-        print(f"\n\033[1m{entry.leader}\033[0m - you're up next, with {entry.title}")
-        print("Please make sure your uke is tuned, and come to the front before the end of the current song.")
-        try:
-            input()
-        except KeyboardInterrupt:
-            print("\nOperation cancelled by user")
-            sys.exit(0)
-
-        print(f"\nProcessing: {entry.title} - {entry.artist}")
-        print(f"Leader: {entry.leader}")
 
-        # Find potential matches
-        matches = find_matches(entry, available_songs)
-        if not matches:
-            print("No matches found!")
-            if confirm_action("Skip this song?"):
+            if selected:
+                if aliases is not None:
+                    aliases.remember(entry, selected.song.href)
+                selected_songs.append(("song", selected))
+                ui.log(f"Selected: {selected.display_name}")
+                # Open the song URL, from the local copy if there is one
+                if open_page(selected.song.href):
+                    stats.add('prefetch.hits')
                 i += 1
-                continue
             else:
-                sys.exit(1)
-
-        # Let user select the match
-        selected, go_back = select_match(matches, f"{entry.title} - {entry.artist}")
-        if go_back:
-            i = max(0, i - 1)  # Go back one song, but not before the start
-            continue
-
-        if selected:
-            selected_songs.append(("song", selected))
-            print(f"\nSelected: {selected.display_name}")
-            # Open the song URL
-            song_url = urljoin(host_url, selected.song.href)
-            webbrowser.open(song_url)
-            i += 1
-        else:
-            print("\nSkipped song")
-            i += 1
+                ui.log("Skipped song")
+                i += 1
 
-    # Only show final break if break_url is configured
-    if break_url:
-        print("\033[2J\033[H")  # Clear screen
-        try:
-            input()
-        except KeyboardInterrupt:
-            print("\nOperation cancelled by user")
-            sys.exit(0)
-        webbrowser.open(urljoin(host_url, break_url))
+        # Only show final break if break_url is configured
+        if break_url:
+            ui.pause()
+            open_page(break_url)
+
+        if mirror_server is not None:
+            # The browser still loads the last page from the local server
+            try:
+                ui.pause(f"Serving the mirrored pages on {mirror_server.base_url}, press Enter to quit")
+            except KeyboardInterrupt:
+                pass
+    except KeyboardInterrupt:
+        ui.log("\nOperation cancelled by user")
+        sys.exit(0)
+    finally:
+        ui.close()
+        # Stop the downloads and drop matches that are still queued, e.g. when the user cancels
+        client.cancel()
+        if refresher is not None:
+            refresher.stop()
+        # Queued matches are dropped first; one still running may finish and ask for its page, which
+        # the prefetcher ignores once shut down
+        match_table.close()
+        if prefetcher is not None:
+            prefetcher.shutdown()
+        if mirror_server is not None:
+            mirror_server.stop()
+        match_executor.shutdown(wait=False, cancel_futures=True)
+
+    print_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+"""
+Persistent store of the songs the operator picked for input list entries
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Collection, Container, Dict, Optional, Tuple
+from .index import normalize
+from .messages import messages
+from .models import InputSong
+
+
+class AliasStore:
+    """
+    Maps normalized (title, artist) pairs from the input list to the href of the chosen song.
+
+    Stored as a JSON-lines file; later lines override earlier ones, so a new
+    choice is a single appended line.
+    """
+
+    def __init__(self, path: str):
+        """
+        Load the alias store.
+
+        Args:
+            path: Path of the JSON-lines file to keep the aliases in
+        """
+        self.path = Path(path).expanduser()
+        self._aliases: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+        try:
+            with self.path.open('r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        alias = json.loads(line)
+                        self._aliases[(alias['title'], alias['artist'])] = alias['href']
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Skip lines damaged by an interrupted write
+        except OSError:
+            pass
+
+    @staticmethod
+    def key(input_song: InputSong) -> Tuple[str, str]:
+        """Get the lookup key for an input song."""
+        return normalize(input_song.title), normalize(input_song.artist)
+
+    def get(self, input_song: InputSong) -> Optional[str]:
+        """Get the href of the song previously chosen for an input song, if any."""
+        with self._lock:
+            return self._aliases.get(self.key(input_song))
+
+    def remember(self, input_song: InputSong, href: str) -> None:
+        """
+        Remember the song chosen for an input song.
+
+        Args:
+            input_song: The song from the input list
+            href: The href of the chosen song from the website
+        """
+        key = self.key(input_song)
+        with self._lock:
+            if self._aliases.get(key) == href:
+                return
+            self._aliases[key] = href
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open('a', encoding='utf-8') as f:
+                    f.write(json.dumps({'title': key[0], 'artist': key[1], 'href': href}) + '\n')
+            except OSError as e:
+                messages.echo(f"WARNING: Could not save song alias: {e}")
+
+    def prune(self, valid_hrefs: Container[str]) -> int:
+        """
+        Forget aliases pointing at songs that are no longer in the songbook.
+
+        Args:
+            valid_hrefs: The hrefs of all songs currently in the songbook
+
+        Returns:
+            int: Number of aliases removed
+        """
+        with self._lock:
+            return self._remove([key for key, href in self._aliases.items() if href not in valid_hrefs])
+
+    def forget(self, removed_hrefs: Collection[str]) -> int:
+        """
+        Forget aliases pointing at songs that were removed from the songbook.
+
+        Args:
+            removed_hrefs: The hrefs of the removed songs
+
+        Returns:
+            int: Number of aliases removed
+        """
+        if not removed_hrefs:
+            return 0
+        with self._lock:
+            return self._remove([key for key, href in self._aliases.items() if href in removed_hrefs])
+
+    def _remove(self, expired: list) -> int:
+        """Remove aliases by key and rewrite the file without them; the lock must be held."""
+        if not expired:
+            return 0
+        for key in expired:
+            del self._aliases[key]
+
+        # Rewrite the file without the expired aliases
+        try:
+            tmp_path = self.path.with_suffix('.tmp')
+            with tmp_path.open('w', encoding='utf-8') as f:
+                for (title, artist), href in self._aliases.items():
+                    f.write(json.dumps({'title': title, 'artist': artist, 'href': href}) + '\n')
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            messages.echo(f"WARNING: Could not save song aliases: {e}")
+        return len(expired)
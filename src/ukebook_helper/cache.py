@@ -0,0 +1,156 @@
+"""
+On-disk cache for the parsed songbook
+"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+from .messages import messages
+from .models import Song
+
+
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60  # One week, in seconds
+
+
+def default_cache_dir() -> Path:
+    """Return the default cache directory, honouring XDG_CACHE_HOME."""
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'ukebook_helper'
+
+
+class CachedSongbook(NamedTuple):
+    """A songbook snapshot together with its HTTP validators."""
+    songs: Dict[str, Song]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class SongbookCache:
+    def __init__(self, directory: Optional[str] = None, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Initialize the cache.
+
+        Args:
+            directory: Directory to store cache files in (defaults to the user cache dir)
+            max_age: Maximum age in seconds before a cached songbook is ignored
+        """
+        self.directory = Path(directory).expanduser() if directory else default_cache_dir()
+        self.max_age = max_age
+
+    def _path_for(self, host_url: str, suffix: str = '.json') -> Path:
+        """Get the cache file path for a host."""
+        netloc = urlparse(host_url).netloc or host_url
+        return self.directory / (re.sub(r'[^A-Za-z0-9.-]', '_', netloc) + suffix)
+
+    def session_path(self, host_url: str) -> Path:
+        """Get the default path of the saved login session for a host."""
+        return self._path_for(host_url, '.session.json')
+
+    def aliases_path(self, host_url: str) -> Path:
+        """Get the default path of the remembered song choices for a host."""
+        return self._path_for(host_url, '.aliases.jsonl')
+
+    def matches_path(self, host_url: str) -> Path:
+        """Get the default path of the match result cache for a host."""
+        return self._path_for(host_url, '.matches.sqlite')
+
+    def store_path(self, host_url: str) -> Path:
+        """Get the default path of the SQLite song store for a host."""
+        return self._path_for(host_url, '.songs.sqlite')
+
+    def pages_dir(self, host_url: str) -> Path:
+        """Get the default directory of the stored song pages for a host."""
+        return self._path_for(host_url, '.pages')
+
+    def load(self, host_url: str, include_expired: bool = False) -> Optional[CachedSongbook]:
+        """
+        Load the cached songbook for a host.
+
+        Args:
+            host_url: Base URL of the Ukebook website
+            include_expired: Also return a snapshot older than max_age, e.g. to diff against
+
+        Returns:
+            The cached songbook, or None if missing, unreadable or expired
+        """
+        try:
+            with self._path_for(host_url).open('r', encoding='utf-8') as f:
+                data = json.load(f)
+            fetched_at = float(data['fetched_at'])
+            if not include_expired and time.time() - fetched_at > self.max_age:
+                return None
+            songs = {key: Song(*fields) for key, *fields in data['songs']}
+            return CachedSongbook(
+                songs=songs,
+                etag=data.get('etag'),
+                last_modified=data.get('last_modified'),
+                fetched_at=fetched_at
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def is_fresh(self, cached: CachedSongbook) -> bool:
+        """Check whether a cached songbook is recent enough to revalidate instead of refetching."""
+        return time.time() - cached.fetched_at <= self.max_age
+
+    def store(self, host_url: str, songs: Dict[str, Song],
+              etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """
+        Store a songbook snapshot for a host.
+
+        Args:
+            host_url: Base URL of the Ukebook website
+            songs: Dictionary mapping song display names to Song objects
+            etag: ETag header of the songbook response, if any
+            last_modified: Last-Modified header of the songbook response, if any
+        """
+        data = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+            'songs': [[key, *song] for key, song in songs.items()]
+        }
+        path = self._path_for(host_url)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated cache
+            tmp_path = path.with_suffix('.tmp')
+            with tmp_path.open('w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            messages.echo(f"WARNING: Could not write songbook cache: {e}")
+
+    def load_gema_numbers(self, host_url: str) -> Dict[str, str]:
+        """
+        Load the GEMA numbers found on song detail pages of a host.
+
+        Returns:
+            Dict[str, str]: Mapping of song href to GEMA number ('' if the page has none)
+        """
+        try:
+            with self._path_for(host_url, '.gema.json').open('r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {str(href): str(gema_nr) for href, gema_nr in data.items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def store_gema_numbers(self, host_url: str, gema_numbers: Dict[str, str]) -> None:
+        """Store the GEMA numbers found on song detail pages of a host."""
+        path = self._path_for(host_url, '.gema.json')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with tmp_path.open('w', encoding='utf-8') as f:
+                json.dump(gema_numbers, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            messages.echo(f"WARNING: Could not write GEMA number cache: {e}")
+
+    def touch(self, host_url: str, cached: CachedSongbook) -> None:
+        """Mark a cached songbook as freshly revalidated."""
+        self.store(host_url, cached.songs, cached.etag, cached.last_modified)
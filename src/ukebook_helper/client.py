@@ -1,18 +1,116 @@
 """
 Ukebook client implementation for handling website interactions
 """
+import codecs
+import json
+import os
+import random
+import re
+import threading
+import time
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from typing import Dict
-from .models import Song
+import urllib3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib.parse import urljoin, urlsplit
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional
+from .models import Song, SongbookDiff, diff_songbooks
+from .cache import SongbookCache
+from .messages import messages
+from .parser import SongListParser
+from .profiling import profiler
+from .store import SongStore
+from .stats import stats
+
+
+# Size of the chunks read from the (possibly compressed) response stream
+CHUNK_SIZE = 64 * 1024
+
+# Concurrent requests made by fetch_many, in total and to a single host
+FETCH_WORKERS = 8
+MAX_PER_HOST = 4
+
+# Methods that are safe to send again after a failure
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD'})
+
+# Server responses worth retrying, e.g. a proxy that lost the backend for a moment
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+# GEMA work number as shown on song detail pages, e.g. "GEMA-Nr.: 123456-001"
+GEMA_PATTERN = re.compile(r'GEMA[^<\d]{0,40}?(\d{4,}(?:-\d{1,3})?)', re.IGNORECASE)
+
+
+class RequestPolicy(NamedTuple):
+    """Timeouts and retries applied to every request of a client."""
+    connect_timeout: float = 5.0   # Seconds to wait for a connection
+    read_timeout: float = 15.0     # Seconds to wait for the server between bytes
+    retries: int = 2               # Extra attempts for GET and HEAD requests
+    backoff: float = 0.5           # Base delay in seconds, doubled on every retry and jittered
+
+
+class NetworkUnavailable(Exception):
+    """
+    The website could not be reached within the retries or time budget.
+
+    Deliberately not a RequestException, so it is not mistaken for a failed
+    login or a broken page but reaches the caller that can fall back to the cache.
+    """
+
+
+class FetchResult(NamedTuple):
+    """Outcome of one request made by fetch_many."""
+    url: str
+    content: Optional[bytes]  # The decompressed body, None if the request failed
+    encoding: Optional[str]   # Charset from the Content-Type header, if any
+    error: Optional[Exception]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def text(self) -> str:
+        """The body decoded as text."""
+        return (self.content or b'').decode(self.encoding or 'utf-8', errors='replace')
 
 
 class UkebookClient:
-    def __init__(self, host_url: str):
-        """Initialize the Ukebook client with the base URL."""
+    def __init__(self, host_url: str, cache: Optional[SongbookCache] = None, compression: bool = True,
+                 session_file: Optional[str] = None, store: Optional[SongStore] = None,
+                 max_per_host: int = MAX_PER_HOST, policy: RequestPolicy = RequestPolicy()):
+        """
+        Initialize the Ukebook client with the base URL.
+
+        Args:
+            host_url: Base URL of the Ukebook website
+            cache: Optional on-disk songbook cache used for conditional requests
+            compression: Negotiate compressed transfers (gzip/deflate, brotli if installed)
+            session_file: Optional file to persist the login session cookies in
+            store: Optional SQLite song store to keep in sync with the songbook
+            max_per_host: Maximum number of concurrent fetch_many requests to a single host
+            policy: Timeouts and retries for all requests
+        """
         self.host_url = host_url.rstrip('/')
         self.session = requests.Session()
+        # Keep enough connections alive for every concurrent request to reuse one
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(FETCH_WORKERS, max_per_host))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.max_per_host = max_per_host
+        self.policy = policy
+        self._deadline: Optional[float] = None
+        self._cancelled = threading.Event()
+        self._fetch_executor: Optional[ThreadPoolExecutor] = None
+        self._host_limits: Dict[str, threading.Semaphore] = {}
+        self._fetch_lock = threading.Lock()
+        self.cache = cache
+        self.compression = compression
+        self.session_file = Path(session_file).expanduser() if session_file else None
+        self.store = store
+        self.last_diff: Optional[SongbookDiff] = None
+        self.last_error: Optional[str] = None
         self._logged_in = False
 
     def login(self, username: str, password: str) -> bool:
@@ -37,72 +135,402 @@ class UkebookClient:
 
         try:
             # Send login request
-            response = self.session.post(
-                login_url,
-                data=login_data,
-                allow_redirects=False  # Don't follow redirects, similar to Go implementation
-            )
+            with profiler.span('login'):
+                response = self._request(
+                    'POST',
+                    login_url,
+                    data=login_data,
+                    allow_redirects=False  # Don't follow redirects, similar to Go implementation
+                )
 
             # Check if login was successful (usually indicated by a redirect)
             if response.status_code in (301, 302):
                 self._logged_in = True
+                self.save_session()
                 return True
 
             return False
 
         except requests.RequestException as e:
-            print(f"Login error: {e}")
+            messages.echo(f"Login error: {e}")
             return False
 
-    def fetch_songs(self) -> Dict[str, Song]:
+    def restore_session(self) -> bool:
+        """
+        Reuse the login session saved by a previous run.
+
+        The saved cookies are validated with a HEAD request to the songbook;
+        a redirect to the login page means they have expired.
+
+        Returns:
+            bool: True if the saved session is still valid, False if a full login is needed
+        """
+        if self.session_file is None:
+            return False
+
+        try:
+            with self.session_file.open('r', encoding='utf-8') as f:
+                cookies = json.load(f)
+            for cookie in cookies:
+                self.session.cookies.set(**cookie)
+        except (OSError, ValueError, TypeError):
+            return False
+
+        try:
+            with profiler.span('login.restore_session'):
+                response = self._request(
+                    'HEAD',
+                    urljoin(self.host_url, '/songbook/'),
+                    allow_redirects=False
+                )
+        except requests.RequestException:
+            self.session.cookies.clear()
+            return False
+
+        if response.is_redirect or not response.ok:
+            # Session expired, start over with a clean cookie jar
+            self.session.cookies.clear()
+            return False
+
+        self._logged_in = True
+        self.save_session()
+        return True
+
+    def save_session(self) -> None:
+        """Save the session cookies to the session file, readable only by the current user."""
+        if self.session_file is None:
+            return
+
+        cookies = [{
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': cookie.secure,
+            'expires': cookie.expires,
+            'rest': cookie._rest
+        } for cookie in self.session.cookies]
+
+        try:
+            self.session_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.session_file.with_suffix('.tmp')
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cookies, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.session_file)
+        except OSError as e:
+            messages.echo(f"WARNING: Could not save login session: {e}")
+
+    def fetch_songs(self, refresh: bool = False, quiet: bool = False) -> Dict[str, Song]:
         """
         Fetch and parse the song list from the website.
 
+        If a cached songbook is available, the request is made conditional on
+        its ETag / Last-Modified validators and a 304 response reuses it as is.
+        The changes against the previously cached snapshot are left in last_diff
+        (None if there was no snapshot to compare with), and why the fetch
+        failed in last_error.
+
+        Args:
+            refresh: Ignore the cache and force a full fetch
+            quiet: Don't show warnings, only leave them in last_error
+
         Returns:
-            Dict[str, Song]: Dictionary mapping song display names to Song objects
+            Dict[str, Song]: Dictionary mapping song display names to Song objects (empty on failure)
         """
         if not self._logged_in:
             raise RuntimeError("Must be logged in to fetch songs")
 
         songbook_url = urljoin(self.host_url, '/songbook/')
 
+        headers = {}
+        if not self.compression:
+            # Opt-out for servers that mishandle compressed responses
+            headers['Accept-Encoding'] = 'identity'
+        self.last_diff = None
+        self.last_error = None
+        previous = self.cache.load(self.host_url, include_expired=True) if self.cache is not None else None
+        cached = previous if previous and not refresh and self.cache.is_fresh(previous) else None
+        if cached:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
         try:
             # Fetch the songbook page
-            response = self.session.get(
-                songbook_url,
-                headers={'Accept-Encoding': 'identity'}  # Prevent compression, matching Go implementation
-            )
+            with profiler.span('fetch.songbook', conditional=bool(cached)):
+                response = self._request('GET', songbook_url, headers=headers, stream=True)
+
+            # Songbook unchanged since the cached copy, skip download and parse
+            if response.status_code == 304 and cached:
+                self.cache.touch(self.host_url, cached)
+                validator = cached.etag or cached.last_modified
+                if self.store is not None and (self.store.validator != validator or not len(self.store)):
+                    self.store.replace(cached.songs, validator)
+                self.last_diff = SongbookDiff(added=[], removed=[], changed=[])
+                return cached.songs
+
             response.raise_for_status()
 
-            # Parse HTML content
-            soup = BeautifulSoup(response.text, 'html.parser')
+            # Extract songs while the page is still streaming in
+            parser = SongListParser()
+            songs = {}
+            with profiler.span('fetch.parse'):
+                for idx, song in parser.parse(self._iter_text(response)):
+                    # Create unique key with index, similar to Go implementation
+                    key = f"{song.title} - {song.artist} ({idx})" if song.artist else f"{song.title} ({idx})"
+                    songs[key] = song
 
-            # Find the song list (ol with class songList)
-            song_list = soup.find('ol', class_='songList')
-            if not song_list:
-                print("WARNING: No songList element found in the HTML!")
+            if not parser.found_list:
+                self.last_error = "WARNING: No songList element found in the HTML!"
+                if not quiet:
+                    messages.echo(self.last_error)
                 return {}
 
-            songs = {}
-            for idx, song_link in enumerate(song_list.find_all('a')):
-                title_elem = song_link.find('strong', class_='songTitle')
-                artist_elem = song_link.find('em', class_='songArtist')
+            if previous:
+                self.last_diff = diff_songbooks(previous.songs, songs)
 
-                if title_elem:
-                    title = title_elem.get_text(strip=True)
-                    artist = artist_elem.get_text(strip=True) if artist_elem else ''
-                    href = song_link.get('href', '')
+            # Written once the download is complete, so matching never waits on it
+            if self.store is not None:
+                self.store.replace(songs, response.headers.get('ETag') or response.headers.get('Last-Modified'))
 
-                    # Create unique key with index, similar to Go implementation
-                    key = f"{title} - {artist} ({idx})" if artist else f"{title} ({idx})"
-                    songs[key] = Song(title=title, artist=artist, href=href)
+            if self.cache is not None and songs:
+                self.cache.store(
+                    self.host_url,
+                    songs,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                )
 
             return songs
 
         except requests.RequestException as e:
-            print(f"Error fetching songs: {e}")
+            self.last_error = f"Error fetching songs: {e}"
+            if not quiet:
+                messages.echo(self.last_error)
             return {}
 
+    def fetch_gema_numbers(self, songs: Dict[str, Song], quiet: bool = False) -> Dict[str, Song]:
+        """
+        Fill in missing GEMA numbers from the song detail pages.
+
+        Detail pages are only fetched for songs the songbook list has no GEMA
+        number for and whose page has not been looked at before; results,
+        including pages without a number, are kept in the cache.
+
+        Args:
+            songs: Dictionary mapping song display names to Song objects
+            quiet: Don't print the pages that could not be fetched, only count them
+
+        Returns:
+            Dict[str, Song]: The same songs, with GEMA numbers filled in where found
+        """
+        known = self.cache.load_gema_numbers(self.host_url) if self.cache is not None else {}
+        missing = {song.href for song in songs.values() if not song.gema_nr and song.href not in known}
+
+        urls = {urljoin(self.host_url, href): href for href in missing}
+        for result in self.fetch_many(urls):
+            if not result.ok:
+                stats.add('gema.failed')
+                if not quiet:
+                    messages.echo(f"Error fetching GEMA number for {urls[result.url]}: {result.error}")
+                continue
+            found = GEMA_PATTERN.search(result.text)
+            known[urls[result.url]] = found.group(1) if found else ''
+
+        if missing and self.cache is not None:
+            self.cache.store_gema_numbers(self.host_url, known)
+
+        return {
+            key: song._replace(gema_nr=known.get(song.href, '')) if not song.gema_nr else song
+            for key, song in songs.items()
+        }
+
+    def fetch_many(self, urls: Iterable[str]) -> Iterator[FetchResult]:
+        """
+        Fetch many URLs concurrently with the client's session.
+
+        Requests run on a shared thread pool, at most max_per_host of them
+        against the same host, and reuse the session's pooled connections.
+
+        Args:
+            urls: Absolute URLs to fetch, each at most once
+
+        Yields:
+            FetchResult: One result per URL, in order of completion
+        """
+        futures = [self._get_fetch_executor().submit(self._fetch, url) for url in dict.fromkeys(urls)]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # The caller stopped early, don't start requests nobody is waiting for
+            for future in futures:
+                future.cancel()
+
+    def _get_fetch_executor(self) -> ThreadPoolExecutor:
+        with self._fetch_lock:
+            if self._fetch_executor is None:
+                self._fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fetch')
+            return self._fetch_executor
+
+    def _fetch(self, url: str) -> FetchResult:
+        """Fetch one URL for fetch_many, streaming the body."""
+        host = urlsplit(url).netloc
+        with self._fetch_lock:
+            limit = self._host_limits.setdefault(host, threading.Semaphore(self.max_per_host))
+        with limit, profiler.span('fetch.get', url=url):
+            try:
+                with self._request('GET', url, stream=True) as response:
+                    response.raise_for_status()
+                    content = b''.join(self._iter_content(response))
+                    return FetchResult(url, content, response.encoding, None)
+            except (requests.RequestException, NetworkUnavailable) as e:
+                return FetchResult(url, None, None, e)
+
+    @contextmanager
+    def deadline(self, seconds: Optional[float]) -> Iterator[None]:
+        """
+        Limit the total time spent on requests made inside the block.
+
+        Timeouts are shortened to the time left, and once it has run out requests
+        raise NetworkUnavailable instead of being sent. Requests made from other
+        threads meanwhile, e.g. by fetch_many, count against the same budget.
+
+        Args:
+            seconds: The time budget (None for no limit)
+        """
+        self._deadline = time.monotonic() + seconds if seconds else None
+        try:
+            yield
+        finally:
+            self._deadline = None
+
+    def cancel(self) -> None:
+        """
+        Stop all network activity, e.g. when the user quits.
+
+        Requests still to be sent and downloads in progress, on any thread,
+        raise NetworkUnavailable from then on.
+        """
+        self._cancelled.set()
+
+    def _timeout(self) -> tuple:
+        """Get the (connect, read) timeout for the next attempt, within the deadline if one is set."""
+        if self._cancelled.is_set():
+            raise NetworkUnavailable("Cancelled")
+        if self._deadline is None:
+            return self.policy.connect_timeout, self.policy.read_timeout
+        remaining = self._deadline - time.monotonic()
+        if remaining <= 0:
+            raise NetworkUnavailable("Ran out of time waiting for the website")
+        return min(self.policy.connect_timeout, remaining), min(self.policy.read_timeout, remaining)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request with the client's timeouts, retrying idempotent ones.
+
+        GET and HEAD requests that fail to connect, time out or get a 502/503/504
+        response are retried with jittered exponential backoff. Other methods are
+        sent once, since the server may have acted on them already.
+
+        Raises:
+            NetworkUnavailable: If no attempt got a response, or the deadline ran out
+            requests.RequestException: For errors retrying does not help with
+        """
+        attempts = 1 + (self.policy.retries if method in IDEMPOTENT_METHODS else 0)
+        error = None
+        for attempt in range(attempts):
+            if attempt:
+                # Full jitter keeps concurrent retries from hitting the server in lockstep
+                delay = random.uniform(0, self.policy.backoff * 2 ** (attempt - 1))
+                if self._deadline is not None and time.monotonic() + delay >= self._deadline:
+                    break
+                time.sleep(delay)
+            try:
+                response = self.session.request(method, url, timeout=self._timeout(), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < attempts - 1:
+                response.close()
+                continue
+            return response
+        raise NetworkUnavailable(f"Could not reach {url}: {error or 'ran out of time'}") from error
+
+    def _iter_content(self, response: requests.Response) -> Iterator[bytes]:
+        """
+        Stream the decompressed body of a response.
+
+        The body is read as it arrives rather than in full chunks, so the time
+        left within a deadline, and cancel(), are checked between reads even
+        when the body trickles in: the read timeout alone only limits each
+        single read.
+
+        Args:
+            response: A response opened with stream=True
+
+        Yields:
+            bytes: Successive chunks of the body
+
+        Raises:
+            NetworkUnavailable: If the deadline ran out or the client was cancelled before the body was complete
+            requests.ConnectionError: If the connection broke off
+        """
+        deadline = self._deadline
+        while True:
+            if self._cancelled.is_set():
+                response.close()
+                raise NetworkUnavailable("Cancelled")
+            if deadline is not None and time.monotonic() >= deadline:
+                response.close()
+                raise NetworkUnavailable(f"Ran out of time downloading {response.url}")
+            try:
+                chunk = response.raw.read1(CHUNK_SIZE, decode_content=True)
+            except urllib3.exceptions.HTTPError as e:
+                response.close()
+                raise requests.ConnectionError(e) from e
+            if not chunk:
+                return
+            yield chunk
+
+    def _iter_text(self, response: requests.Response) -> Iterator[str]:
+        """
+        Stream the decompressed and decoded body of a response.
+
+        Transfer sizes are recorded in the run statistics so the bytes saved
+        by compression can be reported.
+
+        Args:
+            response: A response opened with stream=True
+
+        Yields:
+            str: Successive chunks of the decoded body
+
+        Raises:
+            NetworkUnavailable: If the deadline ran out or the client was cancelled before the body was complete
+            requests.ConnectionError: If the connection broke off
+        """
+        # apparent_encoding would buffer the whole body, so fall back to UTF-8 instead
+        encoding = response.encoding or 'utf-8'
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        decoded_bytes = 0
+
+        for chunk in self._iter_content(response):
+            decoded_bytes += len(chunk)
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+        stats.add('transfer.wire_bytes', response.raw.tell())
+        stats.add('transfer.decoded_bytes', decoded_bytes)
+
     @property
     def is_logged_in(self) -> bool:
         """Check if the client is currently logged in."""
@@ -0,0 +1,289 @@
+"""
+Normalized search index over the songbook
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+from .models import Song, InputSong, SongbookDiff
+from .profiling import profiler
+
+
+# Length of the q-grams in the inverted index
+QGRAM = 3
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize text for matching.
+
+    Casefolds, strips accents, replaces punctuation with spaces and collapses whitespace.
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[\W_]+', ' ', text)
+    return ' '.join(text.split())
+
+
+def combine(title: str, artist: str) -> str:
+    """Combine a normalized title and artist into a single search string."""
+    return f"{title} {artist}" if artist else title
+
+
+def query_string(input_song: InputSong) -> str:
+    """Get the normalized search string for an input song."""
+    return combine(normalize(input_song.title), normalize(input_song.artist))
+
+
+def normalize_gema(gema_nr: str) -> str:
+    """Normalize a GEMA number for exact lookup."""
+    return ''.join(gema_nr.split())
+
+
+def qgrams(text: str) -> Counter:
+    """Count the q-grams of a string."""
+    return Counter(text[i:i + QGRAM] for i in range(len(text) - QGRAM + 1))
+
+
+def required_qgrams(query_length: int, song_length: int, threshold: int) -> int:
+    """
+    Get the number of q-grams a song must share with the query to possibly reach the threshold.
+
+    fuzz.ratio is 100 * (1 - d / (m + n)) for the Indel distance d, and rounds up to
+    the threshold only if d <= (m + n) * (100.5 - threshold) / 100. Each of those d
+    edits destroys at most QGRAM q-grams, so at least max(m, n) - QGRAM + 1 - QGRAM * d
+    q-grams are shared. A result of zero or less means the song cannot be ruled out.
+    """
+    max_distance = (query_length + song_length) * (201 - 2 * threshold) // 200
+    return max(query_length, song_length) - QGRAM + 1 - QGRAM * max_distance
+
+
+def length_bounds(query_length: int, threshold: int) -> Tuple[int, Optional[int]]:
+    """
+    Get the range of song lengths that can possibly reach the threshold against a query.
+
+    The Indel distance is at least the length difference, so fuzz.ratio can
+    never exceed 200 * min(m, n) / (m + n). For it to round up to the threshold
+    that bound must be at least threshold - 0.5.
+
+    Returns:
+        Tuple of (shortest, longest) possible song length, longest being None if unbounded
+    """
+    if threshold <= 0:
+        return 0, None
+    shortest = -(-(2 * threshold - 1) * query_length // (401 - 2 * threshold))
+    longest = (401 - 2 * threshold) * query_length // (2 * threshold - 1)
+    return shortest, longest
+
+
+class SongIndex:
+    """
+    Songbook prepared for matching, built once per songbook load.
+
+    Songs are stored column by column: position i of every column describes
+    the same song. Positions are sorted by the length of the combined string,
+    so every length band is a contiguous slice; the order column holds each
+    song's position in the songbook.
+    """
+
+    def __init__(self, songs: Dict[str, Song], normalized: Optional[Dict[str, Tuple[str, str]]] = None):
+        """
+        Build the index.
+
+        Args:
+            songs: Dictionary mapping song display names to Song objects, as returned by fetch_songs
+            normalized: Already normalized (title, artist) pairs to reuse, by song href
+        """
+        start = time.perf_counter()
+        keys = tuple(songs)
+        titles = []
+        artists = []
+        for song in songs.values():
+            title, artist = (normalized or {}).get(song.href) or (normalize(song.title), normalize(song.artist))
+            titles.append(title)
+            artists.append(artist)
+        combined = [combine(title, artist) for title, artist in zip(titles, artists)]
+        order = sorted(range(len(keys)), key=lambda position: len(combined[position]))
+
+        self.order: Tuple[int, ...] = tuple(order)
+        self.keys: Tuple[str, ...] = tuple(keys[position] for position in order)
+        self.songs: Tuple[Song, ...] = tuple(songs[key] for key in self.keys)
+        self.titles: Tuple[str, ...] = tuple(titles[position] for position in order)
+        self.artists: Tuple[str, ...] = tuple(artists[position] for position in order)
+        self.combined: Tuple[str, ...] = tuple(combined[position] for position in order)
+        self.lengths: Tuple[int, ...] = tuple(len(text) for text in self.combined)
+
+        # Changes whenever any song, or the songbook order, changes
+        self.fingerprint = hashlib.sha256(
+            json.dumps(list(songs.items()), ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+
+        # Exact lookup of songs by href and by GEMA number
+        self.by_href: Dict[str, int] = {song.href: position for position, song in enumerate(self.songs)}
+        self.by_gema: Dict[str, List[int]] = {}
+        for position, song in enumerate(self.songs):
+            if song.gema_nr:
+                self.by_gema.setdefault(normalize_gema(song.gema_nr), []).append(position)
+
+        # The inverted index is only built once a query can actually use it
+        self._postings: Optional[Dict[str, List[int]]] = None
+        self._postings_lock = threading.Lock()
+        profiler.record('index.build', start, time.perf_counter() - start, songs=len(keys),
+                        reused=len(normalized or {}))
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def as_dict(self) -> Dict[str, Song]:
+        """Get the indexed songbook in its original order, as passed to the constructor."""
+        positions = sorted(range(len(self.songs)), key=self.order.__getitem__)
+        return {self.keys[position]: self.songs[position] for position in positions}
+
+    def with_diff(self, songs: Dict[str, Song], diff: SongbookDiff) -> 'SongIndex':
+        """
+        Build the index of an updated songbook, leaving this one untouched.
+
+        Only the added and changed songs are normalized again; everything else
+        is carried over from this index. If this index has built its q-gram
+        postings, they are patched with the changes instead of being rebuilt.
+
+        Args:
+            songs: The updated songbook, as returned by fetch_songs
+            diff: The changes from this index's songbook to the updated one
+
+        Returns:
+            SongIndex: A new index over the updated songbook
+        """
+        stale = {song.href for song in diff.removed} | {new.href for _, new in diff.changed}
+        normalized = {
+            song.href: (title, artist)
+            for song, title, artist in zip(self.songs, self.titles, self.artists)
+            if song.href not in stale
+        }
+        index = SongIndex(songs, normalized)
+        with self._postings_lock:
+            postings = self._postings
+        # Positions are only unambiguous if every href is listed once
+        if postings is not None and len(self.by_href) == len(self) and len(index.by_href) == len(index):
+            with profiler.span('index.patch_postings', changes=len(diff.added) + len(diff.changed) + len(diff.removed)):
+                index._postings = index._patch_postings(self, postings, stale)
+        return index
+
+    def _patch_postings(self, previous: 'SongIndex', postings: Dict[str, List[int]],
+                        stale: set) -> Dict[str, List[int]]:
+        """
+        Derive this index's q-gram postings from those of the index it was updated from.
+
+        Positions of the carried over songs are translated, and only the new and
+        changed songs are split into q-grams.
+
+        Args:
+            previous: The index this one was built from with with_diff
+            postings: The postings of the previous index
+            stale: Hrefs of the songs that were removed or changed
+
+        Returns:
+            The postings of this index
+        """
+        moved = [
+            None if song.href in stale else self.by_href.get(song.href)
+            for song in previous.songs
+        ]
+        patched: Dict[str, List[int]] = {}
+        for gram, positions in postings.items():
+            kept = [moved[position] for position in positions if moved[position] is not None]
+            if kept:
+                patched[gram] = kept
+
+        carried = {position for position in moved if position is not None}
+        for position, combined in enumerate(self.combined):
+            if position not in carried:
+                for gram in qgrams(combined):
+                    patched.setdefault(gram, []).append(position)
+        # Carried over songs mostly keep their relative order, so this is close to linear
+        for positions in patched.values():
+            positions.sort()
+        return patched
+
+    def _get_postings(self) -> Dict[str, List[int]]:
+        """Get the inverted index mapping each q-gram to the positions of the songs containing it."""
+        with self._postings_lock:
+            if self._postings is None:
+                with profiler.span('index.postings'):
+                    postings = {}
+                    for position, combined in enumerate(self.combined):
+                        for gram in qgrams(combined):
+                            postings.setdefault(gram, []).append(position)
+                self._postings = postings
+            return self._postings
+
+    def length_band(self, query: str, threshold: int) -> range:
+        """
+        Get the positions of the songs whose length allows them to reach the threshold.
+
+        Args:
+            query: The normalized search string
+            threshold: Minimum similarity score (0-100)
+
+        Returns:
+            Contiguous range of positions, every song outside it is ruled out by length alone
+        """
+        shortest, longest = length_bounds(len(query), threshold)
+        start = bisect_left(self.lengths, shortest)
+        stop = len(self.lengths) if longest is None else bisect_right(self.lengths, longest)
+        return range(start, max(start, stop))
+
+    def candidates(self, query: str, threshold: int, band: range) -> Sequence[int]:
+        """
+        Select the songs within a length band that could score at or above the threshold.
+
+        A song that has to share T of the query's G q-grams must contain at least
+        one of any G - T + 1 of them, so only the postings of the rarest q-grams
+        are read. Together with the bound from required_qgrams, no song that could
+        reach the threshold is ever dropped.
+
+        Args:
+            query: The normalized search string
+            threshold: Minimum similarity score (0-100)
+            band: Positions to select from, as returned by length_band
+
+        Returns:
+            Sorted positions of the candidate songs, the band itself if the filter cannot rule out any song
+        """
+        if not band:
+            return band
+
+        # Lengths are sorted, so each distinct length in the band is a contiguous run
+        required = []
+        start = band.start
+        while start < band.stop:
+            length = self.lengths[start]
+            stop = min(bisect_right(self.lengths, length, start, band.stop), band.stop)
+            required.append((required_qgrams(len(query), length, threshold), start, stop))
+            start = stop
+        bounded = [count for count, _, _ in required if count > 0]
+        if not bounded:
+            return band
+
+        postings = self._get_postings()
+        query_grams = qgrams(query)
+        prefix_size = sum(query_grams.values()) - min(bounded) + 1
+
+        candidates = set()
+        for gram in sorted(query_grams, key=lambda gram: len(postings.get(gram, ()))):
+            if prefix_size <= 0:
+                break
+            posting = postings.get(gram, ())
+            candidates.update(posting[bisect_left(posting, band.start):bisect_left(posting, band.stop)])
+            prefix_size -= query_grams[gram]
+
+        # Songs whose length admits no q-gram bound stay candidates regardless
+        for count, start, stop in required:
+            if count <= 0:
+                candidates.update(range(start, stop))
+        return sorted(candidates)
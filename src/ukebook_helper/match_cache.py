@@ -0,0 +1,103 @@
+"""
+Persistent cache of match results
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+from .messages import messages
+
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class MatchCache:
+    """
+    Disk-backed LRU cache of find_matches results.
+
+    Entries are only valid for one songbook: binding the cache to a songbook
+    with a different fingerprint empties it.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Open the cache.
+
+        Args:
+            path: Path of the SQLite database file
+            max_entries: Number of entries to keep, least recently used ones are evicted first
+        """
+        self.path = Path(path).expanduser()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS matches (key TEXT PRIMARY KEY, value TEXT, used REAL);
+            CREATE INDEX IF NOT EXISTS matches_used ON matches (used);
+        ''')
+
+    def bind(self, fingerprint: str) -> None:
+        """
+        Bind the cache to a songbook, dropping all entries if it changed.
+
+        Args:
+            fingerprint: Fingerprint of the songbook the matches are computed against
+        """
+        try:
+            with self._lock, self._db:
+                row = self._db.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+                if row is None or row[0] != fingerprint:
+                    self._db.execute("DELETE FROM matches")
+                    self._db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        except sqlite3.Error as e:
+            messages.echo(f"WARNING: Could not update match cache: {e}")
+
+    @staticmethod
+    def key(query: str, gema_nr: str, threshold: int, scorer: str, limit: Optional[int]) -> str:
+        """Build the cache key for a find_matches call."""
+        return json.dumps([query, gema_nr, threshold, scorer, limit])
+
+    def get(self, key: str) -> Optional[Tuple[List[Tuple[str, int]], int]]:
+        """
+        Look up a cached result.
+
+        Returns:
+            Tuple of ([(song href, similarity), ...], discarded count), or None if not cached
+        """
+        try:
+            with self._lock, self._db:
+                row = self._db.execute("SELECT value FROM matches WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self._db.execute("UPDATE matches SET used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error:
+            return None
+        matches, discarded = json.loads(row[0])
+        return [(href, similarity) for href, similarity in matches], discarded
+
+    def put(self, key: str, matches: List[Tuple[str, int]], discarded: int) -> None:
+        """
+        Store a result, evicting the least recently used entries beyond the size cap.
+
+        Args:
+            key: Cache key from MatchCache.key
+            matches: List of (song href, similarity), in find_matches order
+            discarded: Number of matches left out by the limit
+        """
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO matches VALUES (?, ?, ?)",
+                    (key, json.dumps([matches, discarded]), time.time())
+                )
+                self._db.execute(
+                    "DELETE FROM matches WHERE key IN "
+                    "(SELECT key FROM matches ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            messages.echo(f"WARNING: Could not update match cache: {e}")
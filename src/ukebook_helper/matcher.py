@@ -1,9 +1,18 @@
 """
 Fuzzy matching functionality for finding songs
 """
-from typing import Dict, List, NamedTuple
-from thefuzz import fuzz
+import heapq
+import threading
+from concurrent.futures import CancelledError, Executor, Future, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
 from .models import Song, InputSong
+from .index import QGRAM, SongIndex, length_bounds, normalize_gema, query_string
+from .scoring import get_scorer
+from .aliases import AliasStore
+from .match_cache import MatchCache
+from .profiling import profiler
+from .store import DEFAULT_CANDIDATE_LIMIT, SongStore
+from .stats import stats
 
 
 class Match(NamedTuple):
@@ -13,34 +22,322 @@ class Match(NamedTuple):
     similarity: int   # The similarity score (0-100)
 
 
-def find_matches(input_song: InputSong, available_songs: Dict[str, Song], threshold: int = 60) -> List[Match]:
+class MatchList(list):
+    """List of matches that also records how many matches were left out by a limit."""
+
+    def __init__(self, matches: Iterable[Match] = (), discarded: int = 0):
+        super().__init__(matches)
+        self.discarded = discarded
+
+
+def find_matches(input_song: InputSong, song_index: SongIndex, threshold: int = 60, scorer=None,
+                 limit: Optional[int] = None, song_store: Optional[SongStore] = None,
+                 candidate_limit: int = DEFAULT_CANDIDATE_LIMIT) -> MatchList:
     """
     Find potential matches for an input song from the available songs.
 
     Args:
         input_song: The song from the input list to match
-        available_songs: Dictionary of songs from the website
+        song_index: Normalized index of the songs from the website
         threshold: Minimum similarity score (0-100) to consider a match
+        scorer: Scoring backend from get_scorer (defaults to the best available one)
+        limit: Maximum number of matches to return, keeping the best ones (None for all)
+        song_store: Optional song store whose full-text index picks the songs to score, instead of
+            the exact q-gram filter; may miss weak matches
+        candidate_limit: Number of songs to take from the full-text index per query
 
     Returns:
         List of potential matches, sorted by similarity score (lowest first)
     """
-    matches = []
+    # A known GEMA number identifies the song exactly, no fuzzy matching needed
+    gema_nr = normalize_gema(input_song.gema_nr)
+    if gema_nr in song_index.by_gema:
+        stats.add('match.gema_hits')
+        return MatchList(
+            Match(
+                display_name=song_index.keys[position],
+                song=song_index.songs[position],
+                similarity=100
+            )
+            for position in sorted(song_index.by_gema[gema_nr], key=lambda position: song_index.order[position])
+        )
+
+    if scorer is None:
+        scorer = get_scorer()
+
+    # Normalize the search string the same way as the indexed songs
+    search_string = query_string(input_song)
+
+    # Only score the songs whose length and shared q-grams allow them to reach the threshold
+    band = song_index.length_band(search_string, threshold)
+    if song_store is not None and len(search_string) >= QGRAM:
+        # Candidates are limited to the same length band as the in-memory index would use
+        shortest, longest = length_bounds(len(search_string), threshold)
+        hrefs = song_store.candidates(search_string, candidate_limit, shortest, longest) if band else []
+        positions = sorted({
+            position for position in map(song_index.by_href.get, hrefs)
+            if position is not None and position in band
+        })
+    else:
+        positions = song_index.candidates(search_string, threshold, band)
+    if isinstance(positions, range):
+        choices = song_index.combined[positions.start:positions.stop]
+    else:
+        choices = [song_index.combined[position] for position in positions]
+
+    scored = [
+        (similarity, song_index.order[positions[choice]], positions[choice])
+        for choice, similarity in scorer.score(search_string, choices, threshold)
+    ]
+    if limit is not None and len(scored) > limit:
+        # Keep only the best matches with a bounded heap instead of sorting them all
+        best = heapq.nlargest(limit, scored)
+        best.reverse()
+    else:
+        best = sorted(scored)
+    stats.add('match.queries')
+    stats.add('match.scored', len(positions))
+    stats.add('match.pruned_length', len(song_index) - len(band))
+    stats.add('match.pruned_qgram', len(band) - len(positions))
+
+    # Sorted by similarity score (lowest first), ties in songbook order
+    return MatchList((
+        Match(
+            display_name=song_index.keys[position],
+            song=song_index.songs[position],
+            similarity=similarity
+        )
+        for similarity, _, position in best
+    ), discarded=len(scored) - len(best))
+
+
+class MatchTable:
+    """Matches for every song of the input list, precomputed on a worker pool."""
+
+    def __init__(self, input_songs: List[InputSong | str], executor: Executor, threshold: int = 60, scorer=None,
+                 limit: Optional[int] = None, aliases: Optional[AliasStore] = None,
+                 match_cache: Optional[MatchCache] = None, song_store: Optional[SongStore] = None,
+                 candidate_limit: int = DEFAULT_CANDIDATE_LIMIT):
+        """
+        Initialize an empty match table.
+
+        Args:
+            input_songs: Entries of the input list, as returned by read_input_list
+            executor: Worker pool to compute the matches on
+            threshold: Minimum similarity score (0-100) to consider a match
+            scorer: Scoring backend from get_scorer (defaults to the best available one)
+            limit: Maximum number of matches to keep per song (None for all)
+            aliases: Songs the operator chose before, offered instead of fuzzy matches
+            match_cache: Persistent cache of results from previous runs
+            song_store: Optional song store to pick the candidates from with its full-text index
+            candidate_limit: Number of songs to take from the full-text index per query
+        """
+        self.input_songs = input_songs
+        self.threshold = threshold
+        self.scorer = scorer if scorer is not None else get_scorer()
+        self.limit = limit
+        self.aliases = aliases
+        self.match_cache = match_cache
+        self.song_store = song_store
+        self.candidate_limit = candidate_limit
+        self._executor = executor
+        self._song_index: Optional[SongIndex] = None
+        self._futures: Dict[int, Future] = {}
+        self._aliased: Dict[int, Match] = {}
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+        self._closed = False
+
+    def start(self, song_index: SongIndex) -> None:
+        """
+        Submit matching of every input song against the songbook.
+
+        Songs are submitted in input list order, so the entries needed first are ready first.
+        Songs with a remembered alias are not matched at all until alternatives are asked for.
+
+        Args:
+            song_index: Normalized index of the songs from the website
+        """
+        self._submit(song_index)
+        self._started.set()
+
+    def update(self, song_index: SongIndex) -> None:
+        """
+        Switch to a refreshed songbook.
+
+        Matches computed against the previous songbook are dropped and every
+        entry is submitted again; entries not recomputed yet are waited for by get.
+
+        Args:
+            song_index: Normalized index of the refreshed songbook
+        """
+        self._submit(song_index)
+
+    def close(self) -> None:
+        """
+        Stop matching, e.g. when the session ends.
+
+        Queued entries are dropped, and a start or update that comes in later,
+        such as from the network phase finishing after the user quit, does nothing.
+        """
+        with self._lock:
+            self._closed = True
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+
+    @property
+    def closed(self) -> bool:
+        """Whether close() was called."""
+        return self._closed
+
+    def _submit(self, song_index: SongIndex) -> None:
+        """Replace the songbook and submit matching of every entry against it."""
+        futures = {}
+        aliased = {}
+        for index, entry in enumerate(self.input_songs):
+            if not isinstance(entry, InputSong):
+                continue
+
+            href = self.aliases.get(entry) if self.aliases is not None else None
+            position = song_index.by_href.get(href)
+            if position is not None:
+                if not self._started.is_set():
+                    stats.add('match.alias_hits')
+                aliased[index] = Match(
+                    display_name=song_index.keys[position],
+                    song=song_index.songs[position],
+                    similarity=100
+                )
+                futures[index] = Future()
+                futures[index].set_result(MatchList([aliased[index]]))
+
+        with self._lock:
+            if self._closed:
+                return
+            stale = self._futures
+            self._song_index = song_index
+            self._aliased = aliased
+            self._futures = futures
+            if self.match_cache is not None:
+                self.match_cache.bind(song_index.fingerprint)
+            for index, entry in enumerate(self.input_songs):
+                if isinstance(entry, InputSong) and index not in aliased:
+                    futures[index] = self._executor.submit(self._find_matches, entry, song_index)
+        for future in stale.values():
+            future.cancel()
+
+    def get(self, index: int, timeout: Optional[float] = None) -> MatchList:
+        """
+        Get the matches for an input list entry, waiting only if they are not ready yet.
+
+        Args:
+            index: Position of the entry in the input list
+            timeout: Seconds to wait for the matching to start and for the matches (None to wait for good)
+
+        Returns:
+            List of potential matches, sorted by similarity score (lowest first)
+
+        Raises:
+            concurrent.futures.TimeoutError: If the matches were not ready within the timeout
+        """
+        if not self._started.wait(timeout):
+            raise FuturesTimeoutError()
+        while True:
+            with self._lock:
+                future = self._futures[index]
+            try:
+                return future.result(timeout)
+            except CancelledError:
+                with self._lock:
+                    if self._futures[index] is future:
+                        raise
+                # Dropped by a songbook refresh, wait for the recomputed matches instead
+
+    def when_ready(self, index: int, callback: Callable[[MatchList], None]) -> None:
+        """
+        Call a function with the matches for an input list entry once they are computed.
+
+        The callback runs on the worker that computed the matches, or right away if
+        they are ready already. It is not called if the matching fails or is dropped.
+
+        Args:
+            index: Position of the entry in the input list
+            callback: Function to call with the matches
+        """
+        self._started.wait()
+        with self._lock:
+            future = self._futures[index]
+
+        def done(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                callback(future.result())
+
+        future.add_done_callback(done)
+
+    def _compute_matches(self, entry: InputSong, song_index: SongIndex) -> MatchList:
+        """Run find_matches for an entry with the table's settings."""
+        with profiler.span('match.find_matches', title=entry.title):
+            return find_matches(
+                entry, song_index, self.threshold, self.scorer, self.limit, self.song_store, self.candidate_limit
+            )
+
+    def _find_matches(self, entry: InputSong, song_index: SongIndex) -> MatchList:
+        """Find the matches for an entry, reusing the result of a previous run if cached."""
+        if self.match_cache is None:
+            return self._compute_matches(entry, song_index)
+
+        # Full-text candidates can give different results, so they get their own entries
+        backend = self.scorer.name if self.song_store is None else f"{self.scorer.name}+fts{self.candidate_limit}"
+        key = MatchCache.key(query_string(entry), normalize_gema(entry.gema_nr), self.threshold, backend, self.limit)
+        cached = self.match_cache.get(key)
+        if cached is not None:
+            cached_matches, discarded = cached
+            positions = [song_index.by_href.get(href) for href, _ in cached_matches]
+            if None not in positions:
+                stats.add('match.cache_hits')
+                return MatchList((
+                    Match(
+                        display_name=song_index.keys[position],
+                        song=song_index.songs[position],
+                        similarity=similarity
+                    )
+                    for position, (_, similarity) in zip(positions, cached_matches)
+                ), discarded=discarded)
+
+        matches = self._compute_matches(entry, song_index)
+        with self._lock:
+            # A refresh may have rebound the cache to a newer songbook in the meantime
+            if song_index is self._song_index:
+                self.match_cache.put(
+                    key, [(match.song.href, match.similarity) for match in matches], matches.discarded
+                )
+        return matches
 
-    # Create the search string in the same format as the website
-    search_string = f"{input_song.title} - {input_song.artist}"
+    def is_alias(self, index: int) -> bool:
+        """Check whether the matches for an entry are just its remembered alias."""
+        self._started.wait()
+        with self._lock:
+            return index in self._aliased
 
-    # Try matching against each available song
-    for display_name, song in available_songs.items():
-        # Calculate similarity using token sort ratio to handle word order differences
-        similarity = fuzz.ratio(search_string, display_name)
+    def alternatives(self, index: int) -> MatchList:
+        """
+        Run the fuzzy matching for an entry that was answered by its alias.
 
-        if similarity >= threshold:
-            matches.append(Match(
-                display_name=display_name,
-                song=song,
-                similarity=similarity
-            ))
+        Args:
+            index: Position of the entry in the input list
 
-    # Sort matches by similarity score (lowest first)
-    return sorted(matches, key=lambda x: x.similarity)
+        Returns:
+            The fuzzy matches, with the remembered song moved to the end as the best choice
+        """
+        self._started.wait()
+        with self._lock:
+            song_index = self._song_index
+            alias = self._aliased.get(index)
+        matches = self._find_matches(self.input_songs[index], song_index)
+        if alias is None:
+            return matches
+        return MatchList(
+            [match for match in matches if match.song != alias.song] + [alias],
+            discarded=matches.discarded
+        )
@@ -0,0 +1,43 @@
+"""
+Warnings from the background work, printed or shown in the session UI
+"""
+import threading
+from typing import Callable
+
+
+class MessageSink:
+    """
+    Where the warnings of the library modules go.
+
+    Messages are printed by default. While the session UI owns the terminal,
+    printing would draw over its screen, so it takes them into its log instead.
+    """
+
+    def __init__(self):
+        """Initialize the sink, printing messages."""
+        self._echo: Callable[[str], None] = print
+        self._lock = threading.Lock()
+
+    def echo(self, message: str) -> None:
+        """Show a message, from any thread."""
+        with self._lock:
+            echo = self._echo
+        echo(message)
+
+    def redirect(self, echo: Callable[[str], None]) -> Callable[[str], None]:
+        """
+        Send the messages to another function from now on.
+
+        Args:
+            echo: Function to call with every message
+
+        Returns:
+            The function messages went to before, to restore it with
+        """
+        with self._lock:
+            previous, self._echo = self._echo, echo
+        return previous
+
+
+# Shared sink for the whole process
+messages = MessageSink()
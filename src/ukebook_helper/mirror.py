@@ -0,0 +1,99 @@
+"""
+Offline mirror of the song pages needed for an event
+"""
+import os
+import threading
+from concurrent.futures import as_completed
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Optional, Tuple
+from urllib.parse import quote
+from .pages import PageCache, Prefetcher
+
+
+def mirror_pages(prefetcher: Prefetcher, hrefs: Iterable[str],
+                 progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int, int]:
+    """
+    Download pages into the page cache, skipping the ones stored by an earlier run.
+
+    Args:
+        prefetcher: Prefetcher to download with, its worker count bounds the concurrency
+        hrefs: Pages to mirror
+        progress: Optional callback with the number of finished and scheduled downloads
+
+    Returns:
+        Tuple of (pages downloaded, pages already stored, pages that failed)
+    """
+    hrefs = list(dict.fromkeys(hrefs))
+    futures = [future for future in map(prefetcher.prefetch, hrefs) if future is not None]
+    downloaded = failed = 0
+    for done, future in enumerate(as_completed(futures), 1):
+        if future.result():
+            downloaded += 1
+        else:
+            failed += 1
+        if progress is not None:
+            progress(done, len(futures))
+    return downloaded, len(hrefs) - len(futures), failed
+
+
+class _MirrorHandler(SimpleHTTPRequestHandler):
+    """Serves mirrored files, sending everything else on to the website."""
+
+    def __init__(self, *args, host_url: str, **kwargs):
+        self.host_url = host_url
+        super().__init__(*args, **kwargs)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if not os.path.exists(path):
+            self.send_response(302)
+            self.send_header('Location', self.host_url + self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        return super().send_head()
+
+    def log_message(self, format, *args):
+        pass  # Keep the TUI clean
+
+
+class MirrorServer:
+    """Serves the page cache on localhost, so mirrored pages open without the network."""
+
+    def __init__(self, page_cache: PageCache, port: int = 0):
+        """
+        Initialize the server.
+
+        Args:
+            page_cache: Page cache holding the mirrored pages
+            port: Port to listen on (0 picks a free one)
+        """
+        self.page_cache = page_cache
+        handler = partial(_MirrorHandler, directory=str(page_cache.directory), host_url=page_cache.host_url)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mirror', daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """URL of the server."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> None:
+        """Start serving in the background."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url_for(self, href: str) -> Optional[str]:
+        """Get the local URL of a mirrored page, or None if it is not mirrored."""
+        path = self.page_cache.get(href)
+        if path is None:
+            return None
+        return f"{self.base_url}/{quote(path.relative_to(self.page_cache.directory).as_posix())}"
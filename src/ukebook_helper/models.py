@@ -1,7 +1,7 @@
 """
 Data models and file handling for Ukebook Helper
 """
-from typing import List, NamedTuple
+from typing import Dict, List, NamedTuple, Tuple
 from pathlib import Path
 
 
@@ -10,6 +10,7 @@ class Song(NamedTuple):
     title: str
     artist: str
     href: str
+    gema_nr: str = ''
 
 
 class InputSong(NamedTuple):
@@ -20,6 +21,44 @@ class InputSong(NamedTuple):
     leader: str
 
 
+class SongbookDiff(NamedTuple):
+    """Changes between two songbook snapshots, matching songs by href."""
+    added: List[Song]
+    removed: List[Song]
+    changed: List[Tuple[Song, Song]]  # (old, new) pairs
+
+    @property
+    def empty(self) -> bool:
+        """Check whether the snapshots contain the same songs."""
+        return not (self.added or self.removed or self.changed)
+
+
+def diff_songbooks(old: Dict[str, Song], new: Dict[str, Song]) -> SongbookDiff:
+    """
+    Compare two songbook snapshots.
+
+    Display keys contain the position of a song in the songbook and shift
+    whenever songs are added or removed, so songs are matched by href instead.
+
+    Args:
+        old: The previous snapshot, mapping display names to Song objects
+        new: The current snapshot, mapping display names to Song objects
+
+    Returns:
+        SongbookDiff: Added, removed and changed songs, in songbook order
+    """
+    old_by_href = {song.href: song for song in old.values()}
+    new_by_href = {song.href: song for song in new.values()}
+    return SongbookDiff(
+        added=[song for href, song in new_by_href.items() if href not in old_by_href],
+        removed=[song for href, song in old_by_href.items() if href not in new_by_href],
+        changed=[
+            (old_by_href[href], song) for href, song in new_by_href.items()
+            if href in old_by_href and old_by_href[href] != song
+        ]
+    )
+
+
 def read_input_list(filepath: str) -> List[InputSong | str]:
     """
     Read and parse the input.list file.
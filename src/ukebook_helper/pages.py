@@ -0,0 +1,239 @@
+"""
+Local copies of song pages and the files they link to
+"""
+import hashlib
+import os
+import posixpath
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Set
+from urllib.parse import unquote, urljoin, urlsplit
+from .client import UkebookClient
+from .stats import stats
+
+
+# href and src attributes, with the quote character kept so the value can be put back as is
+LINK_PATTERN = re.compile(r'''(\b(?:href|src)\s*=\s*)(["'])(.*?)\2''', re.IGNORECASE | re.DOTALL)
+
+# Linked files that are downloaded along with a page
+ASSET_EXTENSIONS = frozenset({
+    '.pdf', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.css', '.js', '.mp3', '.ogg'
+})
+
+# Links that are left alone when rewriting a page
+UNTOUCHED_SCHEMES = ('#', 'mailto:', 'javascript:', 'data:', 'tel:')
+
+
+class PageCache:
+    """
+    Song pages and their assets stored in a directory that mirrors the site's URL layout.
+
+    Links to downloaded assets are rewritten to relative paths and all other
+    site links to absolute URLs, so a stored page can be opened from disk.
+    """
+
+    def __init__(self, directory: str, host_url: str, max_age: Optional[float] = None):
+        """
+        Initialize the page cache.
+
+        Args:
+            directory: Directory to store the pages in
+            host_url: Base URL of the Ukebook website
+            max_age: Maximum age in seconds before a stored page is fetched again (None for no limit)
+        """
+        self.directory = Path(directory).expanduser()
+        self.host_url = host_url.rstrip('/')
+        self.max_age = max_age
+
+    def path_for(self, url: str, page: bool = False) -> Path:
+        """
+        Get the local path of a site URL.
+
+        Args:
+            url: Absolute or site-relative URL
+            page: The URL is an HTML page, stored as index.html unless it already ends in .htm(l)
+
+        Returns:
+            Path: Location of the file within the cache directory
+        """
+        parts = urlsplit(urljoin(self.host_url + '/', url))
+        segments = [
+            segment for segment in unquote(parts.path).split('/')
+            if segment not in ('', '.', '..')
+        ]
+        if page and not (segments and segments[-1].lower().endswith(('.htm', '.html'))):
+            segments.append('index.html')
+        if not segments:
+            segments = ['index']
+        if parts.query:
+            # Keep URLs that differ only in the query string apart
+            stem, ext = posixpath.splitext(segments[-1])
+            segments[-1] = f"{stem}_{hashlib.sha1(parts.query.encode('utf-8')).hexdigest()[:8]}{ext}"
+        return self.directory.joinpath(*segments)
+
+    def get(self, href: str, page: bool = True) -> Optional[Path]:
+        """Get the stored copy of a page (or other file), or None if it is missing or too old."""
+        path = self.path_for(href, page=page)
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return None
+        if self.max_age is not None and time.time() - mtime > self.max_age:
+            return None
+        return path
+
+    def local_url(self, href: str) -> Optional[str]:
+        """Get a file:// URL for the stored copy of a page, or None if it is not stored."""
+        path = self.get(href)
+        return path.resolve().as_uri() if path is not None else None
+
+    def is_local(self, url: str) -> bool:
+        """Check whether a URL points at the Ukebook website."""
+        return urlsplit(url).netloc == urlsplit(self.host_url).netloc
+
+    def asset_urls(self, page_url: str, html: str) -> Set[str]:
+        """Get the absolute URLs of the site files a page links to."""
+        urls = set()
+        for match in LINK_PATTERN.finditer(html):
+            value = match.group(3).strip()
+            if not value or value.startswith(UNTOUCHED_SCHEMES):
+                continue
+            url = urljoin(page_url, value)
+            extension = posixpath.splitext(urlsplit(url).path)[1].lower()
+            if self.is_local(url) and extension in ASSET_EXTENSIONS:
+                urls.add(url.split('#', 1)[0])
+        return urls
+
+    def rewrite(self, page_url: str, html: str, stored: Set[str]) -> str:
+        """
+        Rewrite the links of a page for opening it from disk.
+
+        Args:
+            page_url: Absolute URL of the page
+            html: The page content
+            stored: Absolute URLs of the assets that were saved next to it
+
+        Returns:
+            str: The page with links to stored assets made relative and all others absolute
+        """
+        page_dir = self.path_for(page_url, page=True).parent
+
+        def replace(match: re.Match) -> str:
+            value = match.group(3).strip()
+            if not value or value.startswith(UNTOUCHED_SCHEMES):
+                return match.group(0)
+            url, _, fragment = urljoin(page_url, value).partition('#')
+            if url in stored:
+                target = Path(os.path.relpath(self.path_for(url), page_dir)).as_posix()
+            else:
+                target = url
+            if fragment:
+                target += '#' + fragment
+            return f"{match.group(1)}{match.group(2)}{target}{match.group(2)}"
+
+        return LINK_PATTERN.sub(replace, html)
+
+    def write(self, url: str, content: bytes, page: bool = False) -> None:
+        """Store a file, replacing any previous copy atomically."""
+        path = self.path_for(url, page=page)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with tmp_path.open('wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+class Prefetcher:
+    """
+    Downloads song pages into a PageCache in the background, each page at most once per run.
+
+    Pages and files already stored are not downloaded again, so an interrupted
+    run picks up where it left off.
+    """
+
+    def __init__(self, client: UkebookClient, page_cache: PageCache, max_workers: int = 2):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            client: Logged in client to fetch the pages with
+            page_cache: Page cache to store the pages in
+            max_workers: Number of pages fetched at the same time
+        """
+        self.client = client
+        self.page_cache = page_cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._scheduled: Set[str] = set()
+        self._assets: Set[str] = set()  # Asset URLs stored during this run
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def prefetch(self, href: str) -> Optional[Future]:
+        """
+        Schedule a page for download, unless it is already stored or scheduled.
+
+        Returns:
+            Future resolving to True once the page is stored (False if it could not be
+            downloaded), or None if nothing was scheduled, e.g. after shutdown
+        """
+        with self._lock:
+            if self._closed or href in self._scheduled:
+                return None
+            self._scheduled.add(href)
+        if self.page_cache.get(href) is not None:
+            return None
+        with self._lock:
+            # Checked again under the lock, shutdown may have come in meanwhile
+            if self._closed:
+                return None
+            return self._executor.submit(self._fetch_page, href)
+
+    def shutdown(self) -> None:
+        """Drop downloads that have not started yet, and ignore any scheduled from now on."""
+        with self._lock:
+            self._closed = True
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_page(self, href: str) -> bool:
+        """Download a page and its assets, storing the page last so it is only used once complete."""
+        page_url = urljoin(self.page_cache.host_url + '/', href)
+        page = next(self.client.fetch_many([page_url]))
+        if not page.ok:
+            return False  # Opened from the website instead when the song comes up
+        # The page is written back with the codec it was read with, which leaves all bytes
+        # outside the rewritten links as they were, even if requests guessed the charset wrong
+        codec = page.encoding or 'utf-8'
+        html = page.content.decode(codec, errors='replace')
+
+        # Download the assets that are not stored yet, all at once
+        stored = set()
+        wanted = []
+        for url in self.page_cache.asset_urls(page_url, html):
+            with self._lock:
+                known = url in self._assets
+            if known or self.page_cache.get(url, page=False) is not None:
+                stored.add(url)
+            else:
+                wanted.append(url)
+        for result in self.client.fetch_many(wanted):
+            if not result.ok:
+                continue  # Linked to the website instead
+            try:
+                self.page_cache.write(result.url, result.content)
+            except OSError:
+                continue
+            stats.add('prefetch.assets')
+            stored.add(result.url)
+            with self._lock:
+                self._assets.add(result.url)
+
+        try:
+            content = self.page_cache.rewrite(page_url, html, stored).encode(codec, errors='xmlcharrefreplace')
+            self.page_cache.write(page_url, content, page=True)
+        except OSError:
+            return False
+        stats.add('prefetch.pages')
+        return True
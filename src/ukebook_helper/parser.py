@@ -0,0 +1,220 @@
+"""
+Streaming extraction of songs from the songbook page
+"""
+from collections import deque
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, List, Optional, Tuple
+from .models import Song
+
+
+# Elements that never have content or an end tag
+VOID_ELEMENTS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+})
+
+
+class _Anchor:
+    """An <a> element inside the song list that is still being parsed."""
+    __slots__ = ('idx', 'href', 'gema_nr', 'title', 'artist', 'gema', 'closed')
+
+    def __init__(self, idx: int, href: str, gema_nr: str):
+        self.idx = idx
+        self.href = href
+        self.gema_nr = gema_nr                   # Value of the data-gema attribute
+        self.title: Optional[List[str]] = None   # Text of the first songTitle element
+        self.artist: Optional[List[str]] = None  # Text of the first songArtist element
+        self.gema: Optional[List[str]] = None    # Text of the first songGema element
+        self.closed = False
+
+
+class SongListParser(HTMLParser):
+    """
+    Incremental parser for the <ol class="songList"> element of the songbook.
+
+    Only the elements inside the first song list are tracked, so memory use
+    does not grow with the size of the page. The extracted values match what
+    BeautifulSoup's find() and get_text(strip=True) return for the same markup.
+
+    GEMA numbers are taken from a data-gema attribute on the <a> element or
+    from a songGema element inside it, where the site provides them.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.found_list = False
+        self.done = False
+        self._outer: List[str] = []  # Elements open before the song list, which may still end it
+        self._stack: List[Tuple[str, Optional[list], Optional[_Anchor]]] = []
+        self._anchors: deque = deque()  # Open or unflushed anchors, in document order
+        self._collectors: List[List[str]] = []
+        self._text: List[str] = []
+        self._count = 0
+        self._ready: List[Tuple[int, Song]] = []
+
+    def parse(self, chunks: Iterable[str]) -> Iterator[Tuple[int, Song]]:
+        """
+        Parse the page from a stream of text chunks.
+
+        Chunks after the end of the song list are still consumed, so the
+        underlying response is fully read, but are not parsed.
+
+        Args:
+            chunks: Successive chunks of the decoded page
+
+        Yields:
+            Tuple[int, Song]: The index of the song's <a> element within the list and the song,
+            emitted as soon as the element is closed
+        """
+        for chunk in chunks:
+            if self.done:
+                continue
+            self.feed(chunk)
+            yield from self._drain()
+        if not self.done:
+            self.close()
+            self._end_list()
+            yield from self._drain()
+
+    def _drain(self) -> Iterator[Tuple[int, Song]]:
+        ready, self._ready = self._ready, []
+        yield from ready
+
+    def _flush_text(self) -> None:
+        """Close the current text node, stripping it like get_text(strip=True)."""
+        if self._text:
+            text = ''.join(self._text).strip()
+            self._text = []
+            if text:
+                for collector in self._collectors:
+                    collector.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if self.done:
+            return
+        attributes = dict(attrs)
+        classes = (attributes.get('class') or '').split()
+
+        if not self.found_list:
+            if tag == 'ol' and 'songList' in classes:
+                self.found_list = True
+                self._stack.append((tag, None, None))
+            elif tag not in VOID_ELEMENTS:
+                self._outer.append(tag)
+            return
+
+        collector = None
+        anchor = None
+        if tag == 'a':
+            anchor = _Anchor(
+                self._count,
+                attributes.get('href') or '',
+                (attributes.get('data-gema') or '').strip()
+            )
+            self._count += 1
+            self._anchors.append(anchor)
+        elif tag == 'strong' and 'songTitle' in classes:
+            collector = []
+            for open_anchor in self._open_anchors():
+                if open_anchor.title is None:
+                    open_anchor.title = collector
+        elif tag == 'em' and 'songArtist' in classes:
+            collector = []
+            for open_anchor in self._open_anchors():
+                if open_anchor.artist is None:
+                    open_anchor.artist = collector
+        elif 'songGema' in classes:
+            collector = []
+            for open_anchor in self._open_anchors():
+                if open_anchor.gema is None:
+                    open_anchor.gema = collector
+
+        if tag in VOID_ELEMENTS:
+            return
+        if collector is not None:
+            self._collectors.append(collector)
+        self._stack.append((tag, collector, anchor))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            return
+        if self._stack and self._stack[-1][0] == tag:
+            self._pop()
+        elif not self.found_list and self._outer and self._outer[-1] == tag:
+            self._outer.pop()
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if self.done:
+            return
+        if not self._stack:
+            # Before the song list, only keep track of the enclosing elements
+            if tag in self._outer:
+                del self._outer[len(self._outer) - 1 - self._outer[::-1].index(tag):]
+            return
+        # Close the most recent open element with this name, and everything inside it
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self._stack[position][0] == tag:
+                while len(self._stack) > position:
+                    self._pop()
+                return
+        if tag in self._outer:
+            # A stray end tag of an element enclosing the list closes the list as well
+            self._end_list()
+
+    def handle_data(self, data):
+        if self._collectors:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_decl(self, decl):
+        self._flush_text()
+
+    def handle_pi(self, data):
+        self._flush_text()
+
+    def unknown_decl(self, data):
+        self._flush_text()
+
+    def _open_anchors(self) -> Iterator[_Anchor]:
+        return (anchor for anchor in self._anchors if not anchor.closed)
+
+    def _pop(self) -> None:
+        """Close the innermost open element."""
+        tag, collector, anchor = self._stack.pop()
+        if collector is not None:
+            # By identity: two collectors holding the same text compare equal
+            self._collectors = [other for other in self._collectors if other is not collector]
+        if anchor is not None:
+            anchor.closed = True
+            self._emit_closed()
+        if not self._stack:
+            self._end_list()
+
+    def _emit_closed(self) -> None:
+        """Emit closed anchors, keeping document order for nested anchors."""
+        while self._anchors and self._anchors[0].closed:
+            anchor = self._anchors.popleft()
+            if anchor.title is not None:
+                self._ready.append((anchor.idx, Song(
+                    title=''.join(anchor.title),
+                    artist=''.join(anchor.artist) if anchor.artist is not None else '',
+                    href=anchor.href,
+                    gema_nr=anchor.gema_nr or ''.join(anchor.gema or ())
+                )))
+
+    def _end_list(self) -> None:
+        """Finish the song list, closing anything left open."""
+        self._flush_text()
+        while self._stack:
+            self._stack.pop()
+        self._collectors = []
+        for anchor in self._anchors:
+            anchor.closed = True
+        self._emit_closed()
+        if self.found_list:
+            self.done = True
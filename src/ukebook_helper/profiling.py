@@ -0,0 +1,128 @@
+"""
+Timing of the phases of a run, for the --profile report and trace files
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+
+class Span(NamedTuple):
+    """A timed section of the run."""
+    name: str
+    start: float      # Seconds since the profiler was created
+    duration: float   # Seconds
+    thread: str       # Name of the thread the section ran on
+    args: Optional[dict] = None
+
+
+class Profiler:
+    """
+    Records how long named sections of the run take.
+
+    Disabled by default; span() then costs about as much as an empty with statement.
+    """
+
+    def __init__(self):
+        """Initialize a disabled profiler."""
+        self.enabled = False
+        self._origin = time.perf_counter()
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Start recording spans."""
+        self.enabled = True
+
+    def span(self, name: str, **args):
+        """
+        Time the body of a with statement.
+
+        Args:
+            name: Name of the section, spans with the same name are summed up in the report
+            **args: Optional details shown with the span in trace viewers
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, args)
+
+    @contextmanager
+    def _span(self, name: str, args: dict) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start, **args)
+
+    def record(self, name: str, start: float, duration: float, **args) -> None:
+        """
+        Record a span that was timed elsewhere.
+
+        Args:
+            name: Name of the section
+            start: time.perf_counter() value at the start of the section
+            duration: Length of the section in seconds
+        """
+        if not self.enabled:
+            return
+        span = Span(name, start - self._origin, duration, threading.current_thread().name, args or None)
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> List[Span]:
+        """Get a copy of the recorded spans."""
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self) -> str:
+        """Format the recorded spans as a table, one row per span name, slowest total first."""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans():
+            totals.setdefault(span.name, []).append(span.duration)
+        rows = sorted(totals.items(), key=lambda item: sum(item[1]), reverse=True)
+
+        width = max([len('Phase')] + [len(name) for name, _ in rows])
+        lines = [f"{'Phase':<{width}}  {'Count':>6}  {'Total ms':>10}  {'Mean ms':>9}  {'Max ms':>9}"]
+        for name, durations in rows:
+            lines.append(
+                f"{name:<{width}}  {len(durations):>6}  {sum(durations) * 1000:>10.1f}  "
+                f"{sum(durations) / len(durations) * 1000:>9.2f}  {max(durations) * 1000:>9.2f}"
+            )
+        return '\n'.join(lines)
+
+    def write_trace(self, path: str) -> None:
+        """
+        Write the recorded spans as a Chrome trace event file.
+
+        The file can be opened in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+        Args:
+            path: File to write the trace to
+        """
+        spans = self.spans()
+        thread_ids = {name: tid for tid, name in enumerate(dict.fromkeys(span.thread for span in spans), 1)}
+        pid = os.getpid()
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for name, tid in thread_ids.items()
+        ]
+        for span in spans:
+            event = {
+                'name': span.name,
+                'ph': 'X',
+                'ts': round(span.start * 1e6, 3),
+                'dur': round(span.duration * 1e6, 3),
+                'pid': pid,
+                'tid': thread_ids[span.thread]
+            }
+            if span.args:
+                event['args'] = {key: str(value) for key, value in span.args.items()}
+            events.append(event)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Shared profiler for the whole process
+profiler = Profiler()
@@ -0,0 +1,96 @@
+"""
+Background refresh of the songbook during a running session
+"""
+import threading
+import time
+from typing import Callable, Optional
+from .client import NetworkUnavailable, UkebookClient
+from .index import SongIndex
+from .models import SongbookDiff
+
+
+DEFAULT_REFRESH_INTERVAL = 300  # Five minutes, in seconds
+
+
+class SongbookRefresher:
+    """
+    Re-fetches the songbook on an interval and swaps in the updated index.
+
+    Each refresh is a conditional request, so an unchanged songbook costs a
+    single 304 response. A changed songbook is applied as a diff to a copy of
+    the current index; readers keep using the old index until it is swapped.
+    """
+
+    def __init__(self, client: UkebookClient, song_index: SongIndex,
+                 on_update: Callable[[SongIndex, SongbookDiff], None],
+                 interval: float = DEFAULT_REFRESH_INTERVAL, gema_lookup: bool = False):
+        """
+        Initialize the refresher.
+
+        Args:
+            client: Logged in client to fetch the songbook with
+            song_index: Index of the songbook fetched at startup
+            on_update: Called on the refresher thread with the new index and the changes
+            interval: Seconds between refreshes
+            gema_lookup: Fill in missing GEMA numbers from the song detail pages
+        """
+        self.client = client
+        self.song_index = song_index
+        self.on_update = on_update
+        self.interval = interval
+        self.gema_lookup = gema_lookup
+        self.refreshed_at: Optional[float] = None
+        self.last_diff: Optional[SongbookDiff] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='refresher', daemon=True)
+
+    def start(self) -> None:
+        """Start refreshing in the background."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop refreshing; a refresh already in progress is left to finish on its own."""
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Fetch the songbook once and apply any changes.
+
+        Returns:
+            bool: True if the songbook changed
+        """
+        try:
+            songs = self.client.fetch_songs(quiet=True)
+            if songs and self.gema_lookup:
+                songs = self.client.fetch_gema_numbers(songs, quiet=True)
+        except NetworkUnavailable:
+            songs = {}
+        if not songs:
+            return False  # Network trouble, keep the current songbook and try again later
+
+        diff = self.client.last_diff
+        if diff is not None and diff.empty:
+            return False
+        song_index = self.song_index.with_diff(songs, diff) if diff is not None else SongIndex(songs)
+        if song_index.fingerprint == self.song_index.fingerprint:
+            return False
+
+        self.song_index = song_index
+        self.last_diff = diff
+        self.refreshed_at = time.time()
+        self.on_update(song_index, diff)
+        return True
+
+    def describe(self) -> Optional[str]:
+        """Get a short note about the last refresh that changed the songbook, if any."""
+        if self.refreshed_at is None:
+            return None
+        note = f"Songbook updated at {time.strftime('%H:%M', time.localtime(self.refreshed_at))}"
+        if self.last_diff is not None:
+            note += (f": {len(self.last_diff.added)} added, {len(self.last_diff.removed)} removed, "
+                     f"{len(self.last_diff.changed)} changed")
+        return note
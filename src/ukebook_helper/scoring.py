@@ -0,0 +1,122 @@
+"""
+Scoring backends for fuzzy matching
+"""
+from typing import List, Sequence, Tuple
+from thefuzz import fuzz
+
+try:
+    from rapidfuzz import fuzz as rapid_fuzz, process as rapid_process
+except ImportError:  # pragma: no cover - rapidfuzz is normally installed with thefuzz
+    rapid_fuzz = rapid_process = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ThefuzzScorer:
+    """Scores choices one by one with thefuzz.fuzz.ratio."""
+    name = 'thefuzz'
+
+    def score(self, query: str, choices: Sequence[str], threshold: int) -> List[Tuple[int, int]]:
+        """
+        Score a query against every choice.
+
+        Args:
+            query: The normalized search string
+            choices: The normalized strings to score against
+            threshold: Minimum similarity score (0-100) to keep
+
+        Returns:
+            List of (position in choices, similarity) for choices at or above the threshold
+        """
+        results = []
+        for position, choice in enumerate(choices):
+            similarity = fuzz.ratio(query, choice)
+            if similarity >= threshold:
+                results.append((position, similarity))
+        return results
+
+
+class RapidfuzzScorer:
+    """Scores all choices in a single native rapidfuzz call."""
+    name = 'rapidfuzz'
+
+    def __init__(self, workers: int = -1):
+        """
+        Initialize the scorer.
+
+        Args:
+            workers: Number of threads rapidfuzz may use for cdist (-1 for all cores)
+        """
+        self.workers = workers
+
+    def score(self, query: str, choices: Sequence[str], threshold: int) -> List[Tuple[int, int]]:
+        """
+        Score a query against every choice.
+
+        Similarities are rounded exactly like thefuzz.fuzz.ratio, so the
+        results are identical to ThefuzzScorer.
+
+        Args:
+            query: The normalized search string
+            choices: The normalized strings to score against
+            threshold: Minimum similarity score (0-100) to keep
+
+        Returns:
+            List of (position in choices, similarity) for choices at or above the threshold
+        """
+        if not choices:
+            return []
+
+        # Anything that rounds up to the threshold must survive the native cutoff
+        cutoff = max(threshold - 0.5, 0)
+
+        if numpy is not None:
+            scores = rapid_process.cdist(
+                [query], choices,
+                scorer=rapid_fuzz.ratio,
+                score_cutoff=cutoff,
+                dtype=numpy.float64,
+                workers=self.workers
+            )[0]
+            positions = numpy.flatnonzero(scores >= cutoff)
+            candidates = zip(positions.tolist(), scores[positions].tolist())
+        else:
+            candidates = (
+                (position, score) for _, score, position in rapid_process.extract(
+                    query, choices, scorer=rapid_fuzz.ratio, score_cutoff=cutoff, limit=None
+                )
+            )
+
+        results = []
+        for position, score in sorted(candidates):
+            similarity = int(round(score))
+            if similarity >= threshold:
+                results.append((position, similarity))
+        return results
+
+
+def get_scorer(name: str = 'auto'):
+    """
+    Get a scoring backend by name.
+
+    Args:
+        name: 'rapidfuzz', 'thefuzz', or 'auto' for rapidfuzz when available
+
+    Returns:
+        The scoring backend
+
+    Raises:
+        ValueError: If the name is unknown or the backend is not installed
+    """
+    if name == 'auto':
+        name = 'rapidfuzz' if rapid_process is not None else 'thefuzz'
+    if name == 'rapidfuzz':
+        if rapid_process is None:
+            raise ValueError("The rapidfuzz scorer requires the rapidfuzz package")
+        return RapidfuzzScorer()
+    if name == 'thefuzz':
+        return ThefuzzScorer()
+    raise ValueError(f"Unknown scorer: {name}")
@@ -0,0 +1,31 @@
+"""
+Counters collected during a run and reported in the run summary
+"""
+import threading
+from typing import Dict
+
+
+class RunStats:
+    def __init__(self):
+        """Initialize an empty set of counters."""
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, amount: int = 1) -> None:
+        """Add an amount to a named counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        """Get the current value of a named counter."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Get a copy of all counters."""
+        with self._lock:
+            return dict(self._counters)
+
+
+# Shared counters for the whole process
+stats = RunStats()
@@ -0,0 +1,164 @@
+"""
+SQLite song store with a full-text trigram index
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+from .messages import messages
+from .models import Song
+from .index import combine, normalize, qgrams
+
+
+# Number of candidates pulled from the full-text index for each query
+DEFAULT_CANDIDATE_LIMIT = 200
+
+
+def fts_available() -> bool:
+    """Check whether the SQLite library supports FTS5 with the trigram tokenizer (SQLite 3.34+)."""
+    try:
+        db = sqlite3.connect(':memory:')
+        try:
+            db.execute("CREATE VIRTUAL TABLE probe USING fts5(text, tokenize='trigram')")
+        finally:
+            db.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+class SongStore:
+    """
+    Persistent copy of the songbook, keyed by song href.
+
+    The normalized title and artist of every song are kept in an FTS5 trigram
+    index, so candidates for a query can be found without scanning the songbook.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open the store, creating it if needed.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = Path(path).expanduser()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS songs (
+                id INTEGER PRIMARY KEY,
+                href TEXT UNIQUE NOT NULL,
+                key TEXT NOT NULL,
+                title TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                gema_nr TEXT NOT NULL,
+                combined TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                combined, content='songs', content_rowid='id', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS songs_insert AFTER INSERT ON songs BEGIN
+                INSERT INTO songs_fts (rowid, combined) VALUES (new.id, new.combined);
+            END;
+            CREATE TRIGGER IF NOT EXISTS songs_delete AFTER DELETE ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, combined) VALUES ('delete', old.id, old.combined);
+            END;
+            DROP TRIGGER IF EXISTS songs_update;
+            CREATE TRIGGER songs_update AFTER UPDATE OF combined ON songs
+            WHEN old.combined IS NOT new.combined BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, combined) VALUES ('delete', old.id, old.combined);
+                INSERT INTO songs_fts (rowid, combined) VALUES (new.id, new.combined);
+            END;
+        ''')
+
+    @property
+    def validator(self) -> Optional[str]:
+        """ETag or Last-Modified header of the songbook response the store was last synced from."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'validator'").fetchone()
+        return row[0] if row else None
+
+    def _upsert(self, key: str, song: Song) -> None:
+        """
+        Insert or update a song, leaving unchanged rows (and their index entries) alone.
+
+        The key holds the song's position in the songbook, so adding one song
+        changes the key of every song after it; it is only rewritten together
+        with the content, never on its own.
+        """
+        combined = combine(normalize(song.title), normalize(song.artist))
+        self._db.execute('''
+            INSERT INTO songs (href, key, title, artist, gema_nr, combined, length)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (href) DO UPDATE SET
+                key = excluded.key, title = excluded.title, artist = excluded.artist,
+                gema_nr = excluded.gema_nr, combined = excluded.combined, length = excluded.length
+            WHERE title != excluded.title OR artist != excluded.artist OR gema_nr != excluded.gema_nr
+        ''', (song.href, key, song.title, song.artist, song.gema_nr, combined, len(combined)))
+
+    def replace(self, songs: Dict[str, Song], validator: Optional[str] = None) -> None:
+        """
+        Sync the store with a complete songbook.
+
+        Everything is written in one short transaction: songs that are not in the
+        songbook are removed, and if anything fails the store is left as it was.
+        An empty songbook leaves the store untouched.
+
+        Args:
+            songs: Dictionary mapping song display names to Song objects
+            validator: ETag or Last-Modified header the songbook was fetched with, if any
+        """
+        if not songs:
+            return
+        seen = {song.href for song in songs.values()}
+        with self._lock:
+            try:
+                for key, song in songs.items():
+                    self._upsert(key, song)
+                removed = [(href,) for href, in self._db.execute("SELECT href FROM songs") if href not in seen]
+                self._db.executemany("DELETE FROM songs WHERE href = ?", removed)
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('validator', ?)", (validator,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                messages.echo(f"WARNING: Could not update song store: {e}")
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def candidates(self, query: str, limit: int = DEFAULT_CANDIDATE_LIMIT,
+                   shortest: int = 0, longest: Optional[int] = None) -> List[str]:
+        """
+        Find the songs sharing the most trigrams with a query.
+
+        This is a ranking heuristic, not a guarantee: a song that would pass the
+        fuzzy threshold can be missing if more than limit songs rank above it.
+
+        Args:
+            query: The normalized search string
+            limit: Maximum number of songs to return
+            shortest: Minimum length of the normalized song string
+            longest: Maximum length of the normalized song string (None for no limit)
+
+        Returns:
+            Hrefs of the candidate songs, best ranked first
+        """
+        grams = [gram for gram in qgrams(query) if '"' not in gram]
+        if not grams:
+            return []
+        expression = ' OR '.join(f'"{gram}"' for gram in grams)
+        with self._lock:
+            rows = self._db.execute('''
+                SELECT songs.href FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid
+                WHERE songs_fts MATCH ? AND songs.length BETWEEN ? AND ?
+                ORDER BY bm25(songs_fts) LIMIT ?
+            ''', (expression, shortest, longest if longest is not None else 2 ** 31, limit)).fetchall()
+        return [href for href, in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
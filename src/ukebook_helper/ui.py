@@ -1,269 +1,339 @@
 """
 TUI elements for interactive song selection
 """
-from typing import List, Optional, Tuple
-import sys
-from prompt_toolkit import prompt
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Callable, List, Optional, Tuple, TypeVar
+import _thread
+import threading
+import time
 from prompt_toolkit.application import Application
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.layout.containers import HSplit, Window
 from prompt_toolkit.layout.controls import FormattedTextControl
 from prompt_toolkit.layout.layout import Layout
-from prompt_toolkit.formatted_text import HTML
-from prompt_toolkit.keys import Keys
+from prompt_toolkit.formatted_text import StyleAndTextTuples
 from .matcher import Match
+from .messages import messages
+from .profiling import profiler
 
+T = TypeVar('T')
 
-def select_match(matches: List[Match], song_title: str) -> Tuple[Optional[Match], bool]:
-    """
-    Display an interactive selection dialog for choosing a match.
+# Choices listed after the matches
+SPECIAL_CHOICES = ('Show other matches', 'Skip', 'Go back')
 
-    Args:
-        matches: List of potential matches to choose from
-        song_title: Title of the input song being matched
+# Number of log lines shown below the menus
+LOG_LINES = 3
 
-    Returns:
-        Tuple of (Selected Match object or None if skipped, bool indicating if user wants to go back)
-    """
-    # Add skip and go back options, with skip after the matches
-    choices = [(m, m.display_name) for m in matches] + [(None, 'Skip'), (None, 'Go back')]
-    selected_index = len(matches) - 1  # Start with last match selected
-
-    def get_choice_text(index: int, choice: tuple) -> str:
-        """Format a single choice."""
-        match = choice[0]
-        is_selected = index == selected_index
-        prefix = "  ▶ " if is_selected else "    "
-
-        # Format with cyan color if selected
-        if is_selected:
-            if choice[1] in ('Skip', 'Go back'):
-                return f"{prefix}<style fg='cyan'>{choice[1]}</style>"
-
-            # For songs, format display name and similarity
-            display_name = choice[0].display_name
-            if len(display_name) > 50:
-                display_name = display_name[:47] + "..."
-            return f"{prefix}<style fg='cyan'>{display_name} ({match.similarity}%)</style>"
-
-        # Non-selected items
-        if choice[1] in ('Skip', 'Go back'):
-            return f"{prefix}{choice[1]}"
-
-        # For non-selected songs
-        display_name = choice[0].display_name
-        if len(display_name) > 50:
-            display_name = display_name[:47] + "..."
-        return f"{prefix}{display_name} ({match.similarity}%)"
-
-    def get_formatted_text():
-        """Get the complete formatted text for display."""
-        title = f'Trying to match: <b>{song_title}</b>\n'
-        choices_text = '\n'.join(get_choice_text(i, c) for i, c in enumerate(choices))
-        return HTML(title + choices_text)
-
-    # Create key bindings
-    kb = KeyBindings()
-    result = [None, False]  # [selected_match, go_back]
-
-    @kb.add('up')
-    def handle_up(event):
-        nonlocal selected_index
-        selected_index = (selected_index - 1) % len(choices)
-        text_area.text = get_formatted_text()
-
-    @kb.add('down')
-    def handle_down(event):
-        nonlocal selected_index
-        selected_index = (selected_index + 1) % len(choices)
-        text_area.text = get_formatted_text()
-
-    @kb.add('enter')
-    def handle_enter(event):
-        choice = choices[selected_index]
-        if choice[1] == 'Go back':
-            result[1] = True
-        else:
-            result[0] = choice[0]
-        event.app.exit()
-
-    @kb.add('c-c')
-    def handle_ctrl_c(event):
-        event.app.exit()
-        print("\nOperation cancelled by user")
-        sys.exit(0)
-
-    # Create the layout
-    text_area = FormattedTextControl(text=get_formatted_text())
-    window = Window(content=text_area)
-    root_container = HSplit([window])
-
-    # Create and run the application
-    application = Application(
-        layout=Layout(root_container),
-        key_bindings=kb,
-        mouse_support=True,
-        full_screen=True
-    )
-
-    try:
-        application.run()
-        return (result[0], result[1])
-    except KeyboardInterrupt:
-        print("\nOperation cancelled by user")
-        sys.exit(0)
-
-
-def confirm_action(prompt_text: str) -> bool:
-    """
-    Display a yes/no confirmation prompt using TUI.
+# Seconds between checks while waiting for background work, which is how
+# quickly a Ctrl+C pressed meanwhile takes effect
+WAIT_INTERVAL = 0.1
+
+# Look of the choices in the menus
+CHOICE_PREFIX = '    '
+SELECTED_PREFIX = '  ▶ '
+SELECTED_STYLE = 'fg:cyan'
 
-    Args:
-        prompt_text: The text to display in the prompt
 
-    Returns:
-        True if confirmed, False otherwise
+class _Screen:
     """
-    choices = [(True, "Yes"), (False, "No")]
-    selected_index = 0  # Default to "Yes"
-
-    def get_choice_text(index: int, choice: tuple) -> str:
-        """Format a single choice."""
-        is_selected = index == selected_index
-        prefix = "  ▶ " if is_selected else "    "
-
-        # Format with cyan color if selected
-        if is_selected:
-            return f"{prefix}<style fg='cyan'>{choice[1]}</style>"
-        return f"{prefix}{choice[1]}"
-
-    def get_formatted_text():
-        """Get the complete formatted text for display."""
-        title = f'<b>{prompt_text}</b>\n'
-        choices_text = '\n'.join(get_choice_text(i, c) for i, c in enumerate(choices))
-        return HTML(title + choices_text)
-
-    # Create key bindings
-    kb = KeyBindings()
-    result = [False]  # Default to No
-
-    @kb.add('up')
-    def handle_up(event):
-        nonlocal selected_index
-        selected_index = (selected_index - 1) % len(choices)
-        text_area.text = get_formatted_text()
-
-    @kb.add('down')
-    def handle_down(event):
-        nonlocal selected_index
-        selected_index = (selected_index + 1) % len(choices)
-        text_area.text = get_formatted_text()
-
-    @kb.add('enter')
-    def handle_enter(event):
-        result[0] = choices[selected_index][0]
-        event.app.exit()
-
-    @kb.add('c-c')
-    def handle_ctrl_c(event):
-        event.app.exit()
-        print("\nOperation cancelled by user")
-        sys.exit(0)
-
-    # Create the layout
-    text_area = FormattedTextControl(text=get_formatted_text())
-    window = Window(content=text_area)
-    root_container = HSplit([window])
-
-    # Create and run the application
-    application = Application(
-        layout=Layout(root_container),
-        key_bindings=kb,
-        mouse_support=True,
-        full_screen=True
-    )
-
-    try:
-        application.run()
-        return result[0]
-    except KeyboardInterrupt:
-        print("\nOperation cancelled by user")
-        sys.exit(0)
-
-
-def confirm_break() -> tuple[bool, bool]:
+    What the session UI shows, and where the answer goes.
+
+    The screen is rendered once into formatted text fragments, three per
+    choice, so moving the selection only swaps the fragments of two lines.
+    """
+
+    def __init__(self, name: str, title: StyleAndTextTuples, choices: Optional[List[str]] = None,
+                 selected: int = 0, show_log: bool = True):
+        """
+        Initialize the screen.
+
+        Args:
+            name: Name of the screen in the profile
+            title: Formatted text shown above the choices
+            choices: Plain text of the choices, None for a screen that just waits for Enter
+            selected: Index of the choice selected at first
+            show_log: Show the last log lines below the choices
+        """
+        self.name = name
+        self.choices = choices or []
+        self.selected = selected
+        self.show_log = show_log
+        self.result: Future = Future()  # Index of the chosen entry
+
+        self.fragments: StyleAndTextTuples = list(title)
+        self._first_choice = len(self.fragments)
+        for index, label in enumerate(self.choices):
+            self.fragments.extend(self._choice_fragments(label, index == selected))
+
+    def select(self, index: int) -> None:
+        """Move the selection to another choice."""
+        for position, selected in ((self.selected, False), (index, True)):
+            start = self._first_choice + 3 * position
+            self.fragments[start:start + 3] = self._choice_fragments(self.choices[position], selected)
+        self.selected = index
+
+    @staticmethod
+    def _choice_fragments(label: str, selected: bool) -> StyleAndTextTuples:
+        if selected:
+            return [('', SELECTED_PREFIX), (SELECTED_STYLE, label), ('', '\n')]
+        return [('', CHOICE_PREFIX), ('', label), ('', '\n')]
+
+
+class SessionUI:
     """
-    Display a break confirmation prompt with go back option.
+    One full screen application for the whole session.
 
-    Returns:
-        Tuple of (take_break: bool, go_back: bool)
+    The application runs on its own thread, while the main thread asks the
+    questions: each question swaps the screen in place and blocks until it
+    is answered, so moving from one prompt to the next is a single redraw.
+    Messages go to a log, shown below the menus and printed to the terminal
+    when the UI is closed; so do the warnings of the library modules meanwhile.
     """
-    choices = [(True, "Take a break"), (False, "Skip break"), (None, "Go back")]
-    selected_index = 0  # Default to "Take a break"
-
-    def get_choice_text(index: int, choice: tuple) -> str:
-        """Format a single choice."""
-        is_selected = index == selected_index
-        prefix = "  ▶ " if is_selected else "    "
-
-        # Format with cyan color if selected
-        if is_selected:
-            return f"{prefix}<style fg='cyan'>{choice[1]}</style>"
-        return f"{prefix}{choice[1]}"
-
-    def get_formatted_text():
-        """Get the complete formatted text for display."""
-        title = '<b>Break time?</b>\n'
-        choices_text = '\n'.join(get_choice_text(i, c) for i, c in enumerate(choices))
-        return HTML(title + choices_text)
-
-    # Create key bindings
-    kb = KeyBindings()
-    result = [False, False]  # [take_break, go_back]
-
-    @kb.add('up')
-    def handle_up(event):
-        nonlocal selected_index
-        selected_index = (selected_index - 1) % len(choices)
-        text_area.text = get_formatted_text()
-
-    @kb.add('down')
-    def handle_down(event):
-        nonlocal selected_index
-        selected_index = (selected_index + 1) % len(choices)
-        text_area.text = get_formatted_text()
-
-    @kb.add('enter')
-    def handle_enter(event):
-        choice = choices[selected_index]
-        if choice[1] == "Go back":
-            result[1] = True
+
+    def __init__(self):
+        """Initialize the UI, showing an empty screen until the first question."""
+        self._screen = _Screen('start', [])
+        self._screen.result.set_result(0)
+        self._log: List[str] = []
+        self._log_lock = threading.Lock()
+        self._closed = False
+        self._previous_echo: Callable[[str], None] = print
+        self._running = threading.Event()
+
+        kb = KeyBindings()
+
+        @kb.add('up')
+        def handle_up(event):
+            self._move(-1)
+
+        @kb.add('down')
+        def handle_down(event):
+            self._move(1)
+
+        @kb.add('enter')
+        def handle_enter(event):
+            screen = self._screen
+            if not screen.result.done():
+                screen.result.set_result(screen.selected)
+
+        @kb.add('c-c')
+        def handle_ctrl_c(event):
+            screen = self._screen
+            if not screen.result.done():
+                screen.result.set_exception(KeyboardInterrupt())
+            else:
+                _thread.interrupt_main()  # Busy between questions, noticed at the next poll of wait()
+
+        self.application = Application(
+            layout=Layout(HSplit([
+                Window(content=FormattedTextControl(self._get_formatted_text)),
+                Window(content=FormattedTextControl(self._get_log_text), height=LOG_LINES)
+            ])),
+            key_bindings=kb,
+            mouse_support=True,
+            full_screen=True
+        )
+        if profiler.enabled:
+            render_start = [0.0]
+
+            def before_render(_) -> None:
+                render_start[0] = time.perf_counter()
+
+            def after_render(_) -> None:
+                profiler.record('ui.render', render_start[0], time.perf_counter() - render_start[0],
+                                prompt=self._screen.name)
+
+            self.application.before_render += before_render
+            self.application.after_render += after_render
+        self._thread = threading.Thread(target=self._run, name='ui', daemon=True)
+
+    def start(self) -> None:
+        """Take over the terminal."""
+        self._thread.start()
+        self._running.wait()
+        self._previous_echo = messages.redirect(self.log)
+
+    def close(self) -> None:
+        """Give the terminal back and print the log, so it stays in the scrollback."""
+        messages.redirect(self._previous_echo)
+        if self._thread.is_alive():
+            self.application.loop.call_soon_threadsafe(self.application.exit)
+            self._thread.join()
+        with self._log_lock:
+            self._closed = True
+            lines, self._log = self._log, []
+        for line in lines:
+            print(line)
+
+    def log(self, message: str) -> None:
+        """Add a message to the log, or print it once the UI is closed."""
+        with self._log_lock:
+            closed = self._closed
+            if not closed:
+                self._log.extend(message.strip('\n').split('\n'))
+        if closed:
+            print(message)
         else:
-            result[0] = choice[0]
-        event.app.exit()
-
-    @kb.add('c-c')
-    def handle_ctrl_c(event):
-        event.app.exit()
-        print("\nOperation cancelled by user")
-        sys.exit(0)
-
-    # Create the layout
-    text_area = FormattedTextControl(text=get_formatted_text())
-    window = Window(content=text_area)
-    root_container = HSplit([window])
-
-    # Create and run the application
-    application = Application(
-        layout=Layout(root_container),
-        key_bindings=kb,
-        mouse_support=True,
-        full_screen=True
-    )
-
-    try:
-        application.run()
-        return (result[0], result[1])
-    except KeyboardInterrupt:
-        print("\nOperation cancelled by user")
-        sys.exit(0)
+            self.application.invalidate()
+
+    def pause(self, text: str = '', show_log: bool = False) -> None:
+        """
+        Show a message, by default on an otherwise blank screen, until Enter is pressed.
+
+        Args:
+            text: Plain text to show
+            show_log: Show the last log lines below the text
+        """
+        self._ask(_Screen('pause', [('', text)], show_log=show_log))
+
+    def announce(self, leader: str, title: str) -> None:
+        """Show the next performer announcement until Enter is pressed."""
+        self._ask(_Screen('announce', [
+            ('', '\n'),
+            ('bold', leader),
+            ('', f" - you're up next, with {title}\n"
+                 "Please make sure your uke is tuned, and come to the front before the end of the current song.")
+        ], show_log=False))
+
+    def confirm(self, prompt_text: str) -> bool:
+        """
+        Display a yes/no confirmation prompt.
+
+        Args:
+            prompt_text: The text to display in the prompt
+
+        Returns:
+            True if confirmed, False otherwise
+        """
+        return self._ask(_Screen('confirm', [('bold', prompt_text), ('', '\n')], ['Yes', 'No'])) == 0
+
+    def confirm_break(self) -> Tuple[bool, bool]:
+        """
+        Display a break confirmation prompt with go back option.
+
+        Returns:
+            Tuple of (take_break: bool, go_back: bool)
+        """
+        choice = self._ask(_Screen(
+            'confirm_break', [('bold', 'Break time?'), ('', '\n')], ['Take a break', 'Skip break', 'Go back']
+        ))
+        return choice == 0, choice == 2
+
+    def select_match(self, matches: List[Match], song_title: str, more: int = 0,
+                     alternatives: Optional[Callable[[], List[Match]]] = None,
+                     notice: Optional[str] = None) -> Tuple[Optional[Match], bool]:
+        """
+        Display an interactive selection dialog for choosing a match.
+
+        Args:
+            matches: List of potential matches to choose from
+            song_title: Title of the input song being matched
+            more: Number of lower scoring matches left out of the list
+            alternatives: Optional callable computing further matches, offered as "Show other matches"
+            notice: Optional status line shown above the title, e.g. that the songbook was refreshed
+
+        Returns:
+            Tuple of (Selected Match object or None if skipped, bool indicating if user wants to go back)
+        """
+        while True:
+            special = SPECIAL_CHOICES if alternatives is not None else SPECIAL_CHOICES[1:]
+            labels = [format_match(match) for match in matches] + list(special)
+            title = [('', 'Trying to match: '), ('bold', song_title), ('', '\n')]
+            if notice:
+                title.insert(0, ('fg:gray', f"↻ {notice}\n"))
+            if more:
+                title.append(('fg:gray', f"    ... and {more} more\n"))
+
+            # Start with the last (best) match selected
+            choice = self._ask(_Screen('select_match', title, labels, selected=max(len(matches) - 1, 0)))
+            if choice < len(matches):
+                return matches[choice], False
+            label = labels[choice]
+            if label == 'Show other matches':
+                # Replace the list in place with the full set of matches
+                matches = alternatives()
+                more = getattr(matches, 'discarded', 0)
+                alternatives = None
+                continue
+            return None, label == 'Go back'
+
+    def wait(self, get: Callable[[float], T], message: str) -> T:
+        """
+        Wait for background work, showing a message if it is not done at once.
+
+        The work is polled rather than waited for in one blocking call, since
+        Ctrl+C can only interrupt the main thread while it runs Python code.
+
+        Args:
+            get: Blocking call taking a timeout in seconds, e.g. Future.result, that
+                raises concurrent.futures.TimeoutError if the work is not done in time
+            message: Plain text to show while waiting
+
+        Returns:
+            Whatever get returned
+
+        Raises:
+            KeyboardInterrupt: If Ctrl+C was pressed
+        """
+        screen = None
+        while True:
+            try:
+                return get(WAIT_INTERVAL)
+            except FuturesTimeoutError:
+                pass
+            if screen is None:
+                screen = _Screen('wait', [('', message)])
+                self._screen = screen
+                self.application.invalidate()
+            elif screen.result.done() and screen.result.exception() is not None:
+                raise screen.result.exception()
+
+    def _ask(self, screen: _Screen) -> int:
+        """
+        Show a screen and wait for it to be answered.
+
+        Returns:
+            Index of the chosen entry (0 for screens without choices)
+
+        Raises:
+            KeyboardInterrupt: If Ctrl+C was pressed
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("The session UI is not running")
+        self._screen = screen
+        self.application.invalidate()
+        return screen.result.result()
+
+    def _move(self, step: int) -> None:
+        """Move the selection of the current screen, wrapping around at the ends."""
+        screen = self._screen
+        if screen.choices and not screen.result.done():
+            screen.select((screen.selected + step) % len(screen.choices))
+
+    def _get_formatted_text(self) -> StyleAndTextTuples:
+        """Get the formatted text of the current screen."""
+        return self._screen.fragments
+
+    def _get_log_text(self) -> StyleAndTextTuples:
+        """Get the last log lines, if the current screen shows them."""
+        if not self._screen.show_log:
+            return []
+        with self._log_lock:
+            return [('fg:gray', '\n'.join(self._log[-LOG_LINES:]))]
+
+    def _run(self) -> None:
+        try:
+            self.application.run(pre_run=self._running.set, handle_sigint=False)
+        finally:
+            self._running.set()
+            screen = self._screen
+            if not screen.result.done():
+                screen.result.set_exception(RuntimeError("The session UI stopped"))
+
+
+def format_match(match: Match) -> str:
+    """Format a match as a choice, shortening long names."""
+    display_name = match.display_name
+    if len(display_name) > 50:
+        display_name = display_name[:47] + "..."
+    return f"{display_name} ({match.similarity}%)"
@@ -0,0 +1,47 @@
+"""
+Tests for updating the song index with a songbook diff
+"""
+from ukebook_helper.index import SongIndex
+from ukebook_helper.models import Song, diff_songbooks
+
+
+def make_songbook(count: int, offset: int = 0) -> dict:
+    """Make a songbook with positional keys, like fetch_songs does."""
+    songs = [Song(f"Song {idx} of {'many ' * (idx % 4)}", f"Artist {idx % 7}", f"/songbook/song/{idx}/", '')
+             for idx in range(count)]
+    return {f"{song.title} - {song.artist} ({offset + idx})": song for idx, song in enumerate(songs)}
+
+
+def test_with_diff_patches_postings():
+    """Postings patched with a diff equal the postings built from scratch."""
+    songs = make_songbook(300)
+    index = SongIndex(songs)
+    index._get_postings()
+
+    items = list(songs.items())
+    updated = {'New Song - Newbie (0)': Song('New Song', 'Newbie', '/songbook/song/new/', '')}
+    for idx, (key, song) in enumerate(items):
+        if idx in (3, 150):
+            continue
+        if idx in (10, 200):
+            song = song._replace(title=song.title + ' live')
+        updated[f"{key} ({idx + 1})"] = song
+
+    patched = index.with_diff(updated, diff_songbooks(songs, updated))
+    assert patched._postings is not None
+    assert patched._postings == SongIndex(updated)._get_postings()
+
+
+def test_with_diff_without_postings_builds_them_lazily():
+    """An index that never built its postings leaves them to the updated index."""
+    songs = make_songbook(20)
+    updated = dict(songs, **{'Extra - Someone (20)': Song('Extra', 'Someone', '/songbook/song/extra/', '')})
+    patched = SongIndex(songs).with_diff(updated, diff_songbooks(songs, updated))
+    assert patched._postings is None
+    assert patched._get_postings() == SongIndex(updated)._get_postings()
+
+
+def test_as_dict_keeps_songbook_order():
+    """The songbook comes back in its original order, not sorted by length."""
+    songs = make_songbook(50)
+    assert list(SongIndex(songs).as_dict().items()) == list(songs.items())
@@ -0,0 +1,97 @@
+"""
+Tests for find_matches against a brute-force fuzz.ratio scan
+"""
+import random
+
+import pytest
+from thefuzz import fuzz
+
+from ukebook_helper.index import SongIndex, combine, normalize
+from ukebook_helper.matcher import find_matches
+from ukebook_helper.models import InputSong, Song, diff_songbooks
+from ukebook_helper.scoring import get_scorer
+
+# Few distinct letters, so that songs share many q-grams and land near every threshold
+ALPHABET = 'abcde '
+
+THRESHOLDS = range(0, 101)
+
+SCORERS = ('thefuzz', 'rapidfuzz')
+
+
+def random_text(rng: random.Random, longest: int) -> str:
+    """Make a random string of up to longest characters, possibly empty."""
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, longest)))
+
+
+def make_songbook(rng: random.Random, count: int, prefix: str = '') -> dict:
+    """Make a songbook of short random songs, many of them with the same length."""
+    songs = {}
+    for idx in range(count):
+        song = Song(random_text(rng, 8), random_text(rng, 5), f"/songbook/song/{prefix}{idx}/", '')
+        songs[f"{song.title} - {song.artist} ({prefix}{idx})"] = song
+    return songs
+
+
+def make_queries(rng: random.Random, songs: dict) -> list:
+    """Make queries: empty, very short, random, and copies of songs with a typo."""
+    queries = [InputSong('', '', '', ''), InputSong('a', '', '', ''), InputSong('ab', '', '', ''),
+               InputSong('abc', '', '', '')]
+    queries += [InputSong(random_text(rng, 10), random_text(rng, 4), '', '') for _ in range(6)]
+    for song in rng.sample(list(songs.values()), 6):
+        title = list(song.title)
+        if title:
+            title[rng.randrange(len(title))] = rng.choice(ALPHABET)
+        queries.append(InputSong(''.join(title), song.artist, '', ''))
+    return queries
+
+
+def brute_force(input_song: InputSong, songs: dict, threshold: int) -> list:
+    """Score every song with fuzz.ratio, lowest first and ties in songbook order."""
+    query = combine(normalize(input_song.title), normalize(input_song.artist))
+    scored = [
+        (fuzz.ratio(query, combine(normalize(song.title), normalize(song.artist))), key)
+        for key, song in songs.items()
+    ]
+    return sorted(((key, similarity) for similarity, key in scored if similarity >= threshold),
+                  key=lambda match: match[1])
+
+
+def assert_same_matches(songs: dict, song_index: SongIndex, queries: list, scorer) -> None:
+    """Check every query at every threshold against the brute-force scan."""
+    for input_song in queries:
+        for threshold in THRESHOLDS:
+            matches = find_matches(input_song, song_index, threshold, scorer)
+            found = [(match.display_name, match.similarity) for match in matches]
+            assert found == brute_force(input_song, songs, threshold), (input_song, threshold)
+
+
+@pytest.mark.parametrize('scorer_name', SCORERS)
+def test_find_matches_equals_brute_force(scorer_name):
+    """The length and q-gram filters never drop a song the full scan would return."""
+    rng = random.Random(9)
+    songs = make_songbook(rng, 120)
+    assert_same_matches(songs, SongIndex(songs), make_queries(rng, songs), get_scorer(scorer_name))
+
+
+@pytest.mark.parametrize('scorer_name', SCORERS)
+def test_find_matches_with_patched_postings_equals_brute_force(scorer_name):
+    """An index updated with with_diff filters exactly like one built from scratch."""
+    rng = random.Random(10)
+    songs = make_songbook(rng, 120)
+    index = SongIndex(songs)
+    index._get_postings()
+
+    updated = {}
+    for idx, (key, song) in enumerate(songs.items()):
+        if idx % 9 == 0:
+            continue
+        if idx % 7 == 0:
+            song = song._replace(title=random_text(rng, 8))
+            key = f"{song.title} - {song.artist} ({idx})"
+        updated[key] = song
+    updated.update(make_songbook(rng, 15, prefix='new'))
+
+    patched = index.with_diff(updated, diff_songbooks(songs, updated))
+    assert patched._postings is not None
+    assert_same_matches(updated, patched, make_queries(rng, updated), get_scorer(scorer_name))
@@ -0,0 +1,51 @@
+"""
+Tests for the local copies of song pages
+"""
+import pytest
+from ukebook_helper.client import FetchResult
+from ukebook_helper.pages import PageCache, Prefetcher
+
+
+HOST_URL = 'http://ukebook.test'
+
+
+class StubClient:
+    """Answers fetch_many with fixed pages, like requests reports them."""
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+
+    def fetch_many(self, urls):
+        for url in urls:
+            content, encoding = self.pages[url]
+            yield FetchResult(url, content, encoding, None)
+
+
+@pytest.mark.parametrize('content, encoding', [
+    # UTF-8 without a charset in the Content-Type header, which requests reports as ISO-8859-1
+    ('<html><body>Mädchen <a href="/songbook/">Back</a></body></html>'.encode('utf-8'), 'ISO-8859-1'),
+    # Latin-1 declared in the page only
+    ('<html><meta charset="iso-8859-1"><body>Mädchen <a href="/songbook/">Back</a></body></html>'.encode('latin-1'),
+     'ISO-8859-1'),
+    # UTF-8 declared in the Content-Type header
+    ('<html><body>Mädchen <a href="/songbook/">Back</a></body></html>'.encode('utf-8'), 'utf-8'),
+])
+def test_stored_page_keeps_its_bytes(tmp_path, content, encoding):
+    """Only the links of a stored page change, its text keeps the encoding it was served in."""
+    page_url = f'{HOST_URL}/songbook/song/1/'
+    page_cache = PageCache(str(tmp_path), HOST_URL)
+    prefetcher = Prefetcher(StubClient({page_url: (content, encoding)}), page_cache)
+    try:
+        assert prefetcher.prefetch('/songbook/song/1/').result()
+    finally:
+        prefetcher.shutdown()
+    expected = content.replace(b'href="/songbook/"', f'href="{HOST_URL}/songbook/"'.encode('ascii'))
+    assert page_cache.get('/songbook/song/1/').read_bytes() == expected
+
+
+def test_prefetch_after_shutdown_is_ignored(tmp_path):
+    """A page asked for after shutdown, e.g. by a match finishing late, is not scheduled."""
+    page_cache = PageCache(str(tmp_path), HOST_URL)
+    prefetcher = Prefetcher(StubClient({}), page_cache)
+    prefetcher.shutdown()
+    assert prefetcher.prefetch('/songbook/song/1/') is None
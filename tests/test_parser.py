@@ -0,0 +1,84 @@
+"""
+Golden file tests for the streaming songbook parser
+"""
+import json
+from pathlib import Path
+import pytest
+from ukebook_helper.parser import SongListParser
+
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+# Chunk sizes the page is fed in, from single characters to the whole page at once
+CHUNK_SIZES = [1, 7, 64, 1024, None]
+
+
+def parse(html: str, chunk_size=None) -> list:
+    """Parse a page fed in chunks of the given size, returning the songs as dicts."""
+    chunk_size = chunk_size or len(html)
+    chunks = (html[start:start + chunk_size] for start in range(0, len(html), chunk_size))
+    return [
+        {'index': idx, 'title': song.title, 'artist': song.artist, 'href': song.href, 'gema_nr': song.gema_nr}
+        for idx, song in SongListParser().parse(chunks)
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_songbook_golden(chunk_size):
+    """The captured songbook page gives the songs BeautifulSoup extracted from it."""
+    html = (FIXTURES / 'songbook.html').read_text(encoding='utf-8')
+    expected = json.loads((FIXTURES / 'songbook.json').read_text(encoding='utf-8'))
+    assert parse(html, chunk_size) == expected
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_stray_end_tag_of_enclosing_element_ends_list(chunk_size):
+    """An end tag of an element around the list closes the list, like in BeautifulSoup."""
+    html = (
+        '<div><ol class="songList">'
+        '<li><a href="/1"><strong class="songTitle">One</strong></a></li>'
+        '</div>'
+        '<a href="/2"><strong class="songTitle">Two</strong></a>'
+        '</ol>'
+    )
+    assert [song['href'] for song in parse(html, chunk_size)] == ['/1']
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_end_tag_of_closed_element_is_ignored(chunk_size):
+    """An end tag of an element that was already closed before the list changes nothing."""
+    html = (
+        '<div></div><ol class="songList">'
+        '<li><a href="/1"><strong class="songTitle">One</strong></a></li>'
+        '</div>'
+        '<li><a href="/2"><strong class="songTitle">Two</strong></a></li>'
+        '</ol>'
+    )
+    assert [song['href'] for song in parse(html, chunk_size)] == ['/1', '/2']
+
+
+def test_missing_song_list():
+    """A page without a song list gives no songs."""
+    parser = SongListParser()
+    assert list(parser.parse(['<html><body><ol class="other"></ol></body></html>'])) == []
+    assert not parser.found_list
+
+
+# Malformed nesting of title and artist, with the songs BeautifulSoup extracts from them
+NESTED_COLLECTORS = [
+    ('<a href="/a"><strong class="songTitle"><em class="songArtist">Art</em> Title</strong></a>',
+     [('ArtTitle', 'Art')]),
+    ('<a href="/a"><em class="songArtist"><strong class="songTitle">Same</strong></em></a>',
+     [('Same', 'Same')]),
+    ('<a href="/a"><strong class="songTitle">T</strong><em class="songArtist"><strong class="songTitle">X</strong>'
+     ' B</em></a>',
+     [('T', 'XB')]),
+]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('body, expected', NESTED_COLLECTORS)
+def test_nested_title_and_artist(body, expected, chunk_size):
+    """Title and artist elements inside each other collect text like in BeautifulSoup."""
+    html = f'<ol class="songList">{body}</ol>'
+    assert [(song['title'], song['artist']) for song in parse(html, chunk_size)] == expected
@@ -0,0 +1,54 @@
+"""
+Tests for the SQLite song store
+"""
+import pytest
+from ukebook_helper.models import Song
+from ukebook_helper.store import SongStore, fts_available
+
+
+pytestmark = pytest.mark.skipif(not fts_available(), reason='SQLite without FTS5 trigram support')
+
+
+def make_songbook(songs: list) -> dict:
+    """Key songs by their position, like fetch_songs does."""
+    return {f"{song.title} - {song.artist} ({idx})": song for idx, song in enumerate(songs)}
+
+
+def test_adding_one_song_only_writes_that_song(tmp_path):
+    """Shifting the positional keys of every other song writes no rows and no index entries."""
+    songs = [Song(f"Song {idx}", f"Artist {idx}", f"/songbook/song/{idx}/", '') for idx in range(1000)]
+    store = SongStore(str(tmp_path / 'songs.db'))
+    store.replace(make_songbook(songs), 'v1')
+
+    before = store._db.total_changes
+    store.replace(make_songbook([Song('New Song', 'Newbie', '/songbook/song/new/', '')] + songs), 'v2')
+    # The new row, the validator and a few FTS5 shadow table writes, not thousands
+    assert store._db.total_changes - before < 20
+    assert len(store) == 1001
+    assert store.candidates('new song newbie')[0] == '/songbook/song/new/'
+
+
+def test_gema_change_keeps_index_entry(tmp_path):
+    """A changed GEMA number updates the row without touching the full-text index."""
+    song = Song('Famous Song', 'Amazing Artist', '/songbook/song/famous/', '')
+    store = SongStore(str(tmp_path / 'songs.db'))
+    store.replace(make_songbook([song]))
+
+    before_index = store._db.execute("SELECT COUNT(*) FROM songs_fts_data").fetchone()[0]
+    store.replace(make_songbook([song._replace(gema_nr='123456-001')]))
+    assert store._db.execute("SELECT COUNT(*) FROM songs_fts_data").fetchone()[0] == before_index
+    assert store.candidates('famous song amazing') == ['/songbook/song/famous/']
+
+
+def test_removed_songs_leave_the_index(tmp_path):
+    """Songs missing from a new songbook are deleted, an empty songbook changes nothing."""
+    songs = [Song(f"Song {idx}", '', f"/songbook/song/{idx}/", '') for idx in range(10)]
+    store = SongStore(str(tmp_path / 'songs.db'))
+    store.replace(make_songbook(songs), 'v1')
+    store.replace(make_songbook(songs[:4]), 'v2')
+    assert len(store) == 4
+    assert '/songbook/song/7/' not in store.candidates('song 7')
+
+    store.replace({}, 'v3')
+    assert len(store) == 4
+    assert store.validator == 'v2'